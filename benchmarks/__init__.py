@@ -0,0 +1 @@
+"""benchmark suite for download_queue, see `benchmarks.run`"""
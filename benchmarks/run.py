@@ -0,0 +1,203 @@
+"""runs benchmark scenarios and reports how the download queue performed.
+
+every scenario is run in a fresh interpreter (unless in_process is given),
+so the peak memory usage and thread count reported belong to that scenario
+alone. results are printed as a table and can be written out as json, which
+a later run can be compared against.
+
+    python -m benchmarks                                 # every scenario
+    python -m benchmarks small_files many_hosts --scale 0.1
+    python -m benchmarks --output new.json --compare old.json
+"""
+import argparse, json, os, platform, subprocess, sys, tempfile, threading, time
+
+from download_queue import DownloadQueue
+from .scenarios import SCENARIOS, scaled
+from .server import start_servers
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Sampler(threading.Thread):
+    """samples the thread count and resident memory of the process until stopped"""
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval     = interval
+        self.peak_threads = threading.active_count()
+        self.peak_rss     = _current_rss()
+        self._stopped     = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)  # minus the sampler
+            rss = _current_rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _current_rss():
+    """resident memory of this process in bytes, None where it can't be read"""
+    try:
+        with open('/proc/self/statm') as fd:
+            return int(fd.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _peak_rss(sampled):
+    """the most memory this process has had resident, in bytes"""
+    if resource is None:
+        return sampled
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes everywhere else
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return None
+    return ordered[min(int(round(percent / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def run_scenario(scenario) -> dict:
+    """run scenario in this process and return its results"""
+    servers = start_servers(scenario.hosts, **scenario.server)
+    sampler = _Sampler()
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='download_queue_bench') as directory:
+            sampler.start()
+            began, futures = time.monotonic(), []
+
+            queue = DownloadQueue(**scenario.queue)
+            for index in range(scenario.files):
+                for host, server in enumerate(servers):
+                    name = '%d-%d' % (host, index)
+                    futures.append(queue.add(server.url(scenario.size, name), os.path.join(directory, name),
+                                             **scenario.downloader))
+            queue.close()
+
+            elapsed = time.monotonic() - began
+            sampler.stop()
+    finally:
+        for server in servers: server.__exit__()
+
+    succeeded = [X for X in futures if X.exception() is None]
+    latencies = sorted(X.downloader.finished_at - X.downloader.queued_at for X in futures)
+    received  = sum(X.bytes_transferred for X in futures)
+    stats     = queue.stats()
+
+    return {
+        'scenario':               scenario.name,
+        'description':            scenario.description,
+        'downloads':              len(futures),
+        'succeeded':              len(succeeded),
+        'failed':                 len(futures) - len(succeeded),
+        'retries':                stats['retries'],
+        'seconds':                elapsed,
+        'bytes':                  received,
+        'bytes_per_second':       received / elapsed,
+        'files_per_second':       len(succeeded) / elapsed,
+        'latency_p50':            _percentile(latencies, 50),
+        'latency_p99':            _percentile(latencies, 99),
+        'time_to_first_byte_p50': stats['time_to_first_byte']['p50'],
+        'time_to_first_byte_p99': stats['time_to_first_byte']['p99'],
+        'peak_rss':               _peak_rss(sampler.peak_rss),
+        'peak_threads':           sampler.peak_threads,
+        'server':                 {key: sum(X.counters[key] for X in servers) for key in servers[0].counters},
+    }
+
+def run_isolated(name, scale) -> dict:
+    """run the scenario called name in a fresh interpreter and return its results"""
+    output = subprocess.run([sys.executable, '-m', 'benchmarks', '--child', name, '--scale', repr(scale)],
+                            cwd=ROOT, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(output)
+
+
+def environment() -> dict:
+    """describe what the benchmarks ran on, so results can be told apart"""
+    try:
+        revision = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        revision = None
+
+    return {
+        'revision':  revision,
+        'python':    platform.python_version(),
+        'platform':  platform.platform(),
+        'cpus':      os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def _format_bytes(count):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if count < 1024 or unit == 'GiB':
+            return '%.1f%s' % (count, unit)
+        count /= 1024
+
+def _format_seconds(seconds):
+    return '-' if seconds is None else '%.1fms' % (seconds * 1000)
+
+def report(results, baseline=None, out=sys.stdout):
+    """print results as a table, with the change from baseline when given"""
+    previous = {X['scenario']: X for X in (baseline or {}).get('results', [])}
+    columns  = ('%-18s %9s %7s %11s %9s %9s %9s %8s %10s'
+                % ('scenario', 'files/s', 'failed', 'throughput', 'p50', 'p99', 'rss', 'threads', 'change'))
+    print(columns, file=out)
+
+    for X in results:
+        before = previous.get(X['scenario'])
+        change = '%+.1f%%' % ((X['bytes_per_second'] / before['bytes_per_second'] - 1) * 100) if before else ''
+        print('%-18s %9.1f %7d %9s/s %9s %9s %9s %8d %10s' % (
+            X['scenario'], X['files_per_second'], X['failed'], _format_bytes(X['bytes_per_second']),
+            _format_seconds(X['latency_p50']), _format_seconds(X['latency_p99']),
+            _format_bytes(X['peak_rss']) if X['peak_rss'] else '-', X['peak_threads'], change,
+        ), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='benchmark download_queue')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='scenarios to run, any of: %s. defaults to all of them' % ', '.join(SCENARIOS))
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply the amount of work in each scenario, eg. 0.1 for a quick run')
+    parser.add_argument('--output', help='write the results, as json, to this file')
+    parser.add_argument('--compare', help='show the change in throughput from results written by --output')
+    parser.add_argument('--in-process', action='store_true',
+                        help='run every scenario in this interpreter, peak rss then covers all of them')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    unknown = [X for X in args.scenarios if X not in SCENARIOS]
+    if unknown:
+        parser.error('unknown scenarios: %s' % ', '.join(unknown))
+
+    if args.child:  # run one scenario for run_isolated
+        json.dump(run_scenario(scaled(SCENARIOS[args.child], args.scale)), sys.stdout)
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        if args.in_process:
+            results.append(run_scenario(scaled(SCENARIOS[name], args.scale)))
+        else:
+            results.append(run_isolated(name, args.scale))
+
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'environment': environment(), 'scale': args.scale, 'results': results}, fd, indent=2)
@@ -0,0 +1,52 @@
+"""the workloads the benchmarks put download queues through"""
+import collections
+
+from download_queue import HostLimit, SegmentedDownloader
+
+KiB, MiB = 2 ** 10, 2 ** 20
+
+Scenario = collections.namedtuple('Scenario', [
+    'name',
+    'description',
+    'hosts',       # number of origin servers the files are spread across
+    'files',       # number of files downloaded from each host, multiplied by scale
+    'size',        # bytes in each file
+    'server',      # keyword arguments for each `benchmarks.server.BenchmarkServer`
+    'queue',       # keyword arguments for the `download_queue.DownloadQueue`
+    'downloader',  # keyword arguments given to every call to add
+])
+
+# NOTE scale multiplies the number of files of scenarios with many files and the
+#      size of files of scenarios with a few huge files, see `scaled`.
+SCENARIOS = collections.OrderedDict((X.name, X) for X in [
+    Scenario('small_files', 'many small files from one fast origin',
+             hosts=1, files=2000, size=16 * KiB, server={},
+             queue={'length': 16}, downloader={}),
+    Scenario('high_latency', 'many small files from an origin slow to respond',
+             hosts=1, files=400, size=4 * KiB, server={'latency': 0.05},
+             queue={'length': 32}, downloader={}),
+    Scenario('large_files', 'a few huge files streamed to disk',
+             hosts=1, files=4, size=128 * MiB, server={},
+             queue={'length': 4}, downloader={'stream': True, 'chunk_size': 64 * KiB}),
+    Scenario('segmented_files', 'a few huge files over bandwidth capped connections, in segments',
+             hosts=1, files=2, size=32 * MiB, server={'bandwidth': 16 * MiB},
+             queue={'length': 8},
+             downloader={'download_class': SegmentedDownloader, 'segments': 4, 'chunk_size': 64 * KiB}),
+    Scenario('bandwidth_capped', 'medium files over bandwidth capped connections',
+             hosts=1, files=16, size=4 * MiB, server={'bandwidth': 8 * MiB},
+             queue={'length': 8}, downloader={'stream': True, 'chunk_size': 64 * KiB}),
+    Scenario('flaky_origin', 'an origin failing or dropping a quarter of its responses',
+             hosts=1, files=400, size=256 * KiB, server={'error_rate': 0.15, 'truncate_rate': 0.1},
+             queue={'length': 16},
+             downloader={'stream': True, 'attempt_count': 10, 'attempt_interval': 0.01}),
+    Scenario('many_hosts', 'small files spread across many origins with per host limits',
+             hosts=16, files=100, size=8 * KiB, server={'latency': 0.005},
+             queue={'length': 32, 'host_limit': HostLimit(max_connections=4)}, downloader={}),
+])
+
+
+def scaled(scenario, scale):
+    """scenario resized by scale, see SCENARIOS"""
+    if scenario.files * scenario.hosts > 16:
+        return scenario._replace(files=max(int(scenario.files * scale), 1))
+    return scenario._replace(size=max(int(scenario.size * scale), 1))
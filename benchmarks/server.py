@@ -0,0 +1,197 @@
+"""configurable local http server the benchmarks download from.
+
+Bodies aren't stored, they're generated from a repeating block, so serving
+huge files doesn't inflate the memory usage of the benchmark process. every
+path has the form /<size>/<name>, where size is the length of the body in
+bytes and name is anything that makes the url unique.
+"""
+import threading, random, time, typing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BLOCK = bytes(range(256)) * 256  # 64KiB written repeatedly to make up bodies
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """request handler for bodies which can be requested in ranges. shared with
+    the server of the test suite, so both answer Range and If-Range the same way.
+    HEAD requests are answered by do_GET, which mustn't send a body for them.
+
+    NOTE Range requests are only honoured when the ranges attribute of the server is truthy.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args): pass  # keep output quiet
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def _send_head(self, etag, length):
+        """send the status and headers of a response to a body of length bytes,
+        or to the range of it requested. returns the first and last byte of the
+        body to send, or Nones when the range couldn't be satisfied."""
+        start, end = self._range(etag, length)
+        if start is not None and start >= length:
+            self._send_empty(416, {'Content-Range': 'bytes */%d' % length})
+            return None, None
+
+        if start is None:
+            self.send_response(200)
+            start, end = 0, length - 1
+        else:
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, length))
+
+        self.send_header('Content-Length', str(end + 1 - start))
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        return start, end
+
+    def _range(self, etag, length):
+        """get the first and last byte of the requested range, or Nones when the
+        full body should be sent. etag is None when the body doesn't have one."""
+        value = self.headers.get('Range')
+        if not self.server.ranges or not value or not value.startswith('bytes='):
+            return None, None
+
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and (etag is None or if_range != etag):
+            return None, None
+
+        start, end = value[len('bytes='):].split('-', 1)
+        return int(start), min(int(end), length - 1) if end else length - 1
+
+    def _send_empty(self, status, headers={}):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class _Handler(RangeHandler):
+    def do_GET(self):
+        server = self.server.owner
+        server._count('requests')
+
+        try:
+            size = int(self.path.split('/')[1])
+        except (IndexError, ValueError):
+            return self._send_empty(404)
+
+        if server.latency:
+            time.sleep(server.latency)  # before the response headers, ie. time to first byte
+
+        if server.error_rate and server.random() < server.error_rate:
+            server._count('errors')
+            return self._send_empty(503)
+
+        etag       = '"%d"' % size  # bodies never change, so the size identifies them
+        start, end = self._send_head(etag, size)
+        if start is None or self.command == 'HEAD':
+            return
+
+        length = end + 1 - start
+        if server.truncate_rate and server.random() < server.truncate_rate:
+            server._count('truncated')
+            length, self.close_connection = length // 2, True
+
+        self._write_body(server, start, length)
+
+    def _write_body(self, server, offset, length):
+        """write length bytes of the body from offset, no faster than server.bandwidth"""
+        began, sent = time.monotonic(), 0
+        view        = memoryview(BLOCK)
+
+        while sent < length:
+            position = (offset + sent) % len(BLOCK)
+            chunk    = view[position:position + min(len(BLOCK) - position, length - sent)]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+
+            if server.bandwidth:
+                ahead = sent / server.bandwidth - (time.monotonic() - began)
+                if ahead > 0: time.sleep(ahead)
+
+        server._count('bytes', sent)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads     = True
+    request_queue_size = 256  # many workers connect at once
+
+    @property
+    def ranges(self): return self.owner.ranges
+
+
+class BenchmarkServer(object):
+    """serves generated bodies on a local address from a background thread.
+
+    Parameters
+    ----------
+    host
+        the address to listen on. every address in 127.0.0.0/8 is local on
+        linux, so servers on different addresses act as different hosts.
+    latency
+        seconds to wait before responding to each request.
+    bandwidth
+        the most bytes per second sent on each connection, None for no limit.
+    error_rate
+        the fraction of requests (between 0 and 1) answered with a 503.
+    truncate_rate
+        the fraction of responses whose connection is dropped half way through the body.
+    ranges
+        when truthy, Range requests (guarded by If-Range) are honoured.
+    seed
+        seeds the random choice of which requests fail, so runs are repeatable.
+    """
+    def __init__(self, host: str = '127.0.0.1', latency: float = 0,
+                 bandwidth: typing.Optional[float] = None, error_rate: float = 0,
+                 truncate_rate: float = 0, ranges: bool = True, seed: int = 0):
+        self.latency       = latency
+        self.bandwidth     = bandwidth
+        self.error_rate    = error_rate
+        self.truncate_rate = truncate_rate
+        self.ranges        = ranges
+        self.counters      = {'requests': 0, 'errors': 0, 'truncated': 0, 'bytes': 0}
+
+        self._lock   = threading.Lock()
+        self._random = random.Random(seed)
+
+        self.httpd       = _Server((host, 0), _Handler)
+        self.httpd.owner = self
+
+    def url(self, size: int, name: str = '') -> str:
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%d/%d/%s' % (host, port, size, name)
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_servers(count: int, **kwargs) -> typing.List[BenchmarkServer]:
+    """start count servers, each on its own loopback address when the platform
+    allows it, and otherwise on their own ports of 127.0.0.1."""
+    servers = []
+    for X in range(count):
+        try:
+            server = BenchmarkServer('127.0.0.%d' % (X + 1), seed=X, **kwargs)
+        except OSError:  # only 127.0.0.1 is bound to the loopback interface
+            server = BenchmarkServer('127.0.0.1', seed=X, **kwargs)
+        servers.append(server.__enter__())
+    return servers
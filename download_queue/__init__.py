@@ -1,2 +1,11 @@
 from .queue import DownloadQueue
-from .downloader import GenericDownloader
+from .downloader import GenericDownloader, IntegrityError
+from .futures import DownloadFuture
+from .segmented import SegmentedDownloader
+from .sessions import SessionPool
+from .limits import HostLimit, TokenBucket, AdaptiveConcurrency
+from .stats import QueueStats
+from .cache import ResponseCache
+from .buffers import MemoryBudget
+from .journal import Journal
+from .aio import AsyncDownloadQueue, AsyncGenericDownloader
@@ -0,0 +1,268 @@
+import os, io, asyncio, inspect, typing
+from abc import ABCMeta, abstractmethod
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, see `AsyncDownloadQueue`
+    aiohttp = None
+
+from .decorators import async_repeat_on_error
+from .downloader import DEFAULT_HEADERS, FileType
+from .queue import LoggerOrTruthyType, _resolve_logger
+
+
+class AsyncDownloadQueue(object):
+    """asyncio counterpart of `download_queue.DownloadQueue`.
+
+    Downloads are coroutines run on the event loop of the calling code instead
+    of jobs run by worker threads, so thousands of downloads can be in flight at
+    once from a single thread. The queue length is enforced by a semaphore and
+    every downloader shares a single `aiohttp.ClientSession`, whose connector
+    keeps connections to each host alive between downloads.
+
+        async with AsyncDownloadQueue(500) as queue:
+            for url, path in targets:
+                await queue.add(url, path)
+
+    NOTE this requires the optional aiohttp dependency, `pip install download_queue[async]`.
+
+    Parameters
+    ----------
+    length
+        the amount of concurrent downloads the queue is allowed to fascilitate.
+    logger
+        the logger to be used by this object, see `download_queue.DownloadQueue`.
+    session
+        the aiohttp session every download is made through. when not given one
+        is created (on the first call to add) and closed alongside the queue.
+    limit_per_host
+        the maximum number of simultaneous connections to a single host, used
+        when the queue creates its own session. 0 means no limit.
+    """
+    def __init__(self, length: int = 100, logger: LoggerOrTruthyType = None,
+                 session: typing.Optional['aiohttp.ClientSession'] = None,
+                 limit_per_host: int = 0):
+        if aiohttp is None:
+            raise ImportError('AsyncDownloadQueue requires aiohttp, install it with: pip install aiohttp')
+
+        self.max_length, self.length = length, 0
+        self.limit_per_host          = limit_per_host
+        self.logger                  = _resolve_logger(logger)
+
+        self._session       = session
+        self._owns_session  = session is None
+        self._available_s   = None  # created lazily, so it binds to the running loop
+        self._tasks         = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+    @property
+    def session(self) -> 'aiohttp.ClientSession':
+        if self._session is None:
+            connector     = aiohttp.TCPConnector(limit=self.max_length, limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def add(self, *args, **kwargs):
+        """begin a new download using the given args and kwargs. waits
+        when to many downloads are already taking place.
+
+        See also: `download_queue.aio.AsyncDownloader`
+
+        Parameters
+        ----------
+        download_class
+            the download_queue.aio.AsyncDownloader like class which is to be
+            initialised and then begun
+        """
+        dclass  = kwargs.pop('download_class', AsyncGenericDownloader)
+        dloader = dclass(self, *args, completion_hook=self._complete_handler, **kwargs)
+        # NOTE init downloader before acquiring semaphore for it, because it could fail
+
+        if self._available_s is None:
+            self._available_s = asyncio.BoundedSemaphore(self.max_length)
+
+        await self._available_s.acquire()
+        self.length += 1
+
+        task = asyncio.ensure_future(dloader.download())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    enqueue = add
+
+    def _complete_handler(self, downloader):
+        """invoke after a download coroutine is complete"""
+        self.length -= 1
+        self._available_s.release()
+
+    async def wait_until_finished(self):
+        """waits until all active downloads, including any added while waiting, finish"""
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    wait_to_finish = wait_until_finished
+
+    async def close(self):
+        """wait for all active downloads to finish and then close the session
+        of the queue, when the queue created it."""
+        await self.wait_until_finished()
+
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def ready(self):
+        return self.length < self.max_length
+
+    @property
+    def qlength(self): return self.max_length
+
+
+class AsyncDownloader(metaclass=ABCMeta):
+    def __init__(self, download_queue, **kwargs):
+        """coroutine based counterpart of `download_queue.Downloader`,
+        accepting the same keyword arguments. session, when given,
+        must be an `aiohttp.ClientSession` and is used instead of the
+        session of the download queue. completion_hook may be either
+        a function or a coroutine function.
+        """
+        self.queue   = download_queue
+        self.headers = DEFAULT_HEADERS.copy()
+        self.params  = {}
+        self.cookies = {}
+        self.session = kwargs.pop('session', None)
+
+        self.headers.update(kwargs.pop('headers', {}))
+        self.cookies.update(kwargs.pop('cookies', {}))
+        self.params.update(kwargs.pop('params', {}))
+
+        self.chunk_size       = kwargs.pop('chunk_size', 2 ** 10)
+        self.comhook          = kwargs.pop('completion_hook', None)
+        self.block_on_error   = kwargs.pop('block_on_error', False)
+
+        self.complete = False
+
+        if len(kwargs) > 0:  # unremoved keyword arguments exist
+            raise ValueError("%s received unexpected keyword arguments: %s" % (
+                self.__class__.__name__, ', '.join(kwargs.keys())
+            ))
+
+    async def download(self):
+        if self.complete:
+            raise RuntimeError('downloader %s already completed' % hex(id(self)))
+
+        self.logger.debug('attempting to download: %s' % (repr(self.serialise_args())[1:-1]))
+
+        try:
+            await self._download()
+        except (KeyboardInterrupt, Exception) as e: self._error_handler(e)
+        else:                                       self._pass_handler()
+        finally:
+            if self.comhook:
+                result = self.comhook(self)
+                if inspect.isawaitable(result): await result
+
+    def _error_handler(self, e):
+        if self.block_on_error:
+            raise e  # reraise
+
+    def _pass_handler(self):
+        self.complete = True
+
+    @property
+    def logger(self): return self.queue.logger
+
+    def _request(self, method, url, **kwargs):
+        """make a request through the session given to this downloader or
+        the session of the download queue. use as an async context manager."""
+        session = self.session if self.session is not None else self.queue.session
+        return session.request(method, url, **kwargs)
+
+    @abstractmethod
+    def serialise_args(self):
+        """primmed arguments list to be used by the logger should download fail"""
+        pass
+
+    @abstractmethod
+    async def _download(self):
+        """actually downloads what the downloader is supposed to download"""
+        pass
+
+
+class AsyncGenericDownloader(AsyncDownloader):
+    def __init__(self, download_queue,
+                 link:                     str,
+                 dest:                     FileType,
+                 close_fd:                 bool = True,
+                 delete_failed_fd:         bool = False,
+                 overwrite_existing_files: bool = False,
+                 **kwargs):
+        """coroutine based counterpart of `download_queue.GenericDownloader`.
+        the response is read into memory and written to dest once complete,
+        see `download_queue.GenericDownloader` for the meaning of each argument.
+
+        NOTE writing to dest blocks the event loop, which is fine for the
+             small files this queue is meant for. stream large files with
+             `download_queue.GenericDownloader` instead.
+        """
+        self.link                      = link
+        self.destination               = dest
+        self._close_fd                 = close_fd
+        self._delete_failed_fd         = delete_failed_fd
+        self._overwrite_existing_files = overwrite_existing_files
+
+        # optional member attributes
+        if 'attempt_count' in kwargs:    self.attempt_count    = kwargs.pop('attempt_count')
+        if 'attempt_interval' in kwargs: self.attempt_interval = kwargs.pop('attempt_interval')
+        if 'attempt_backoff' in kwargs:  self.attempt_backoff  = kwargs.pop('attempt_backoff')
+
+        super().__init__(download_queue, **kwargs)
+
+    @async_repeat_on_error(('attempt_count', 10), ('attempt_interval', 3))
+    async def _download(self):
+        """read response into buffer and then dump to file, before closing"""
+        buffer = io.BytesIO()
+
+        async with self._request('GET', self.link, headers=self.headers, params=self.params,
+                                 cookies=self.cookies) as response:
+            response.raise_for_status()
+
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                buffer.write(chunk)
+
+        destination = self._get_dest_fd()
+        destination.write(buffer.getbuffer())
+        if self._close_fd:  # also flushes file
+            destination.close()
+
+    def _get_dest_fd(self):
+        """get file like object to write to. Also repositions cursor at start of file"""
+        if isinstance(self.destination, str):  # assume filepath
+            if not self._overwrite_existing_files and os.path.exists(self.destination):
+                raise FileExistsError(self.destination)
+
+            self.destination = open(self.destination, 'wb')
+
+        # assume file like object
+        self.destination.seek(0)
+        return self.destination
+
+    def _error_handler(self, error):
+        if self._delete_failed_fd and hasattr(self.destination, 'name'):
+            name = self.destination.name
+            self.destination.close()
+
+            try:
+                os.remove(name)
+            except OSError: pass
+
+        super()._error_handler(error)
+
+    def serialise_args(self):
+        return [self.link, self.destination.name if hasattr(self.destination, 'name') else self.destination]
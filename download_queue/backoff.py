@@ -0,0 +1,114 @@
+import random, time, typing
+from abc import ABCMeta, abstractmethod
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# client errors which are worth retrying, every other 4xx response is fatal
+RETRYABLE_STATUS_CODES = frozenset([408, 425, 429])
+
+
+class Backoff(metaclass=ABCMeta):
+    """policy deciding how long to wait before retrying a failed download"""
+    @abstractmethod
+    def delay(self, attempt: int, previous: typing.Optional[float]) -> float:
+        """seconds to wait after the given (1 based) failed attempt. previous
+        is the delay returned for the attempt before, or None after the first."""
+        pass
+
+
+class ConstantBackoff(Backoff):
+    """always wait interval seconds"""
+    def __init__(self, interval: float):
+        self.interval = interval
+
+    def delay(self, attempt, previous):
+        return self.interval
+
+
+class ExponentialBackoff(Backoff):
+    """wait base * factor ** (attempt - 1) seconds, capped at cap seconds.
+
+    jitter spreads out the retries of downloads which failed at the same time,
+    so they don't retry in step against an origin which is already struggling.
+
+    Parameters
+    ----------
+    base
+        the delay after the first failed attempt.
+    factor
+        how much the delay grows with every further attempt.
+    cap
+        the longest delay allowed.
+    jitter
+        None for no jitter, 'full' for a random delay between 0 and the
+        exponential delay, 'equal' for half the exponential delay plus a random
+        delay upto the other half, or 'decorrelated' for a random delay between
+        base and three times the previous delay.
+    """
+    JITTERS = (None, 'full', 'equal', 'decorrelated')
+
+    def __init__(self, base: float = 1, factor: float = 2, cap: float = 60,
+                 jitter: typing.Optional[str] = 'full'):
+        if jitter not in self.JITTERS:
+            raise ValueError('unknown jitter %r, expected one of %r' % (jitter, self.JITTERS))
+
+        self.base, self.factor, self.cap, self.jitter = base, factor, cap, jitter
+
+    def delay(self, attempt, previous):
+        if self.jitter == 'decorrelated':
+            return min(self.cap, random.uniform(self.base, (previous or self.base) * 3))
+
+        delay = min(self.cap, self.base * self.factor ** (attempt - 1))
+        if self.jitter == 'full':
+            return random.uniform(0, delay)
+        if self.jitter == 'equal':
+            return delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+
+def is_retryable(error: BaseException) -> bool:
+    """whether a download which failed with error could succeed if it's retried.
+    client errors such as a 404 and a destination which already exists are fatal,
+    everything else (connection errors, server errors, timeouts...) is retryable."""
+    if isinstance(error, FileExistsError):
+        return False
+
+    status = _error_status(error)
+    if status is not None:
+        return not (400 <= status < 500) or status in RETRYABLE_STATUS_CODES
+
+    return True
+
+
+def retry_after(error: BaseException) -> typing.Optional[float]:
+    """seconds the server asked us to wait before retrying, through the Retry-After
+    header of the response which caused error. None when it didn't ask."""
+    headers = _error_headers(error)
+    value   = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None  # unparseable date
+
+
+def _error_status(error):
+    """status code of the response which caused error, for both requests and aiohttp"""
+    response = getattr(error, 'response', None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return response.status_code
+    status = getattr(error, 'status', None)  # aiohttp.ClientResponseError
+    return status if isinstance(status, int) else None
+
+def _error_headers(error):
+    response = getattr(error, 'response', None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return response.headers
+    return getattr(error, 'headers', None)  # aiohttp.ClientResponseError
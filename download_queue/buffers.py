@@ -0,0 +1,160 @@
+import io, os, tempfile, threading, typing
+
+RESERVE_BLOCK = 2 ** 16  # bytes reserved from a budget at a time, see SpillBuffer
+
+
+class MemoryBudget(object):
+    """thread safe account of the bytes of responses held in memory by the
+    downloaders of a download queue, see the memory_budget argument of
+    `download_queue.DownloadQueue`.
+
+    Downloaders reserve space from the budget as their buffers grow. once a
+    reservation would take the bytes in use past limit, it's refused and the
+    buffer is moved to a temporary file on disk instead.
+
+    Parameters
+    ----------
+    limit
+        the most bytes of buffers held in memory at once. None for no limit,
+        in which case the budget only keeps count of them.
+    directory
+        the directory buffers are spilled to. defaults to the temporary
+        directory of the system, see `tempfile.gettempdir`.
+    """
+    def __init__(self, limit: typing.Optional[int] = None, directory: typing.Optional[str] = None):
+        self.limit     = limit
+        self.directory = directory
+
+        self._lock  = threading.Lock()
+        self.used   = 0  # bytes currently reserved
+        self.peak   = 0  # most bytes ever reserved at once
+        self.spills = 0  # buffers moved to disk
+
+    def __repr__(self):
+        return '%s(limit=%r, used=%r)' % (self.__class__.__name__, self.limit, self.used)
+
+    def reserve(self, amount: int) -> bool:
+        """take amount bytes from the budget, returning whether they were available"""
+        with self._lock:
+            if self.limit is not None and self.used + amount > self.limit:
+                return False
+            self.used += amount
+            self.peak  = max(self.peak, self.used)
+            return True
+
+    def release(self, amount: int):
+        """give back amount bytes taken with reserve"""
+        with self._lock:
+            self.used -= amount
+
+    def spilled(self):
+        with self._lock:
+            self.spills += 1
+
+
+class SpillBuffer(object):
+    """file like buffer for a response, held in memory while budget allows it
+    and moved to a temporary file once it doesn't. the space it takes from the
+    budget, and any temporary file, is given back when it's closed.
+
+    NOTE only the methods downloaders use are provided, it isn't an `io.IOBase`.
+
+    Parameters
+    ----------
+    budget
+        the :obj:`MemoryBudget` the buffer reserves space from. without one
+        the buffer is never moved to disk.
+    """
+    def __init__(self, budget: typing.Optional[MemoryBudget] = None):
+        self.budget    = budget
+        self.path      = None  # of the temporary file, once spilled
+        self._file     = io.BytesIO()
+        self._reserved = 0
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def closed(self): return self._file.closed
+
+    def write(self, data) -> int:
+        if self.path is None:
+            end = self._file.tell() + len(data)
+            if end > self._reserved and not self._reserve(end):
+                self._spill()
+        return self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes: return self._file.read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int: return self._file.seek(offset, whence)
+
+    def tell(self) -> int: return self._file.tell()
+
+    def truncate(self, size: typing.Optional[int] = None) -> int:
+        size = self._file.truncate(size)
+        if self.path is None:  # give back what's no longer needed
+            self._release(self._reserved - _round_up(size))
+        return size
+
+    def flush(self): self._file.flush()
+
+    def getbuffer(self) -> typing.Optional[memoryview]:
+        """a view of the buffer, without copying it. None once it's on disk."""
+        return self._file.getbuffer() if self.path is None else None
+
+    def getvalue(self) -> bytes:
+        if self.path is None:
+            return self._file.getvalue()
+
+        position = self._file.tell()
+        self._file.seek(0)
+        try:
+            return self._file.read()
+        finally:
+            self._file.seek(position)
+
+    def close(self):
+        """free the buffer, removing its temporary file"""
+        if self._file.closed:
+            return
+
+        self._file.close()
+        self._release(self._reserved)
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError: pass
+
+    def _reserve(self, size):
+        amount = _round_up(size) - self._reserved
+        if self.budget is not None and not self.budget.reserve(amount):
+            return False
+        self._reserved += amount
+        return True
+
+    def _release(self, amount):
+        if amount > 0:
+            self._reserved -= amount
+            if self.budget is not None: self.budget.release(amount)
+
+    def _spill(self):
+        """move the buffer to a temporary file, giving back its reservation"""
+        fd, path = tempfile.mkstemp(dir=self.budget.directory, suffix='.spill')
+        spill = os.fdopen(fd, 'w+b')
+        try:
+            with self._file.getbuffer() as view:
+                spill.write(view)
+            spill.seek(self._file.tell())
+        except BaseException:
+            spill.close()
+            os.remove(path)
+            raise
+
+        self._file.close()
+        self._file, self.path = spill, path
+        self._release(self._reserved)
+        self.budget.spilled()
+
+
+def _round_up(size):
+    return -(-size // RESERVE_BLOCK) * RESERVE_BLOCK
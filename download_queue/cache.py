@@ -0,0 +1,185 @@
+import collections, hashlib, json, os, shutil, tempfile, threading, time, typing
+
+CacheEntry = collections.namedtuple('CacheEntry', ['url', 'path', 'etag', 'last_modified', 'sha256', 'size'])
+
+
+class ResponseCache(object):
+    """on disk cache of downloaded files and the validators they were served with.
+
+    When a downloader finds a url in the cache it makes a conditional request
+    (If-None-Match/If-Modified-Since) for it, and if the server answers 304 Not
+    Modified the cached body is copied (or hard linked) to the destination instead
+    of being downloaded again. Every successful download of a response with an
+    ETag or Last-Modified header is stored, the least recently used entries being
+    evicted once the cache grows past max_size bytes.
+
+    Each entry is a body file and a json file of its metadata (the url, ETag,
+    Last-Modified, sha256 digest and size of the body) named by a hash of the url,
+    so the cache can be shared between runs and processes.
+
+    Parameters
+    ----------
+    directory
+        the directory entries are stored in, created when it doesn't exist.
+    max_size
+        the most bytes of bodies kept in the cache.
+    hard_links
+        when truthy, cached bodies are hard linked to destinations instead of
+        being copied, when they're on the same filesystem.
+
+        NOTE a hard linked destination shares its contents with the cache, so
+             modifying it in place also modifies the cached body.
+    """
+    body_suffix = '.body'
+    meta_suffix = '.json'
+
+    def __init__(self, directory: str, max_size: int = 2 ** 30, hard_links: bool = False):
+        self.directory  = directory
+        self.max_size   = max_size
+        self.hard_links = hard_links
+
+        self._lock    = threading.Lock()
+        self._entries = collections.OrderedDict()  # key => size, least recently used first
+        self._size    = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self): return len(self._entries)
+
+    def __contains__(self, url): return self._key(url) in self._entries
+
+    @property
+    def size(self) -> int:
+        """the bytes of bodies currently in the cache"""
+        return self._size
+
+    def lookup(self, url: str) -> typing.Optional[CacheEntry]:
+        """get the entry for url, marking it as recently used, or None when it isn't cached"""
+        key = self._key(url)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            with open(self._path(key, self.meta_suffix)) as fd:
+                meta = json.load(fd)
+            os.utime(self._path(key, self.body_suffix))  # persists the use for later runs
+        except (OSError, ValueError):  # removed by another process
+            self._forget(key)
+            return None
+
+        return CacheEntry(meta['url'], self._path(key, self.body_suffix), meta['etag'],
+                          meta['last_modified'], meta['sha256'], meta['size'])
+
+    def store(self, url: str, source: typing.Union[str, bytes, memoryview],
+              etag: typing.Optional[str] = None, last_modified: typing.Optional[str] = None) -> typing.Optional[CacheEntry]:
+        """add the body of url, either a path to it or the bytes of it, to the cache.
+        returns the new entry, or None when the body is larger than the whole cache."""
+        key  = self._key(url)
+        body = self._path(key, self.body_suffix)
+
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                digest = hashlib.sha256()
+                if isinstance(source, str):
+                    with open(source, 'rb') as input:
+                        for block in iter(lambda: input.read(2 ** 20), b''):
+                            digest.update(block)
+                            output.write(block)
+                else:
+                    digest.update(source)
+                    output.write(source)
+                size = output.tell()
+
+            if size > self.max_size:
+                os.remove(temp)
+                return None
+
+            meta = {'url': url, 'etag': etag, 'last_modified': last_modified,
+                    'sha256': digest.hexdigest(), 'size': size, 'stored': time.time()}
+            os.replace(temp, body)
+            with open(self._path(key, self.meta_suffix), 'w') as output:
+                json.dump(meta, output)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError: pass
+            raise
+
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+        self._evict()
+
+        return CacheEntry(url, body, etag, last_modified, meta['sha256'], size)
+
+    def restore(self, entry: CacheEntry, path: str):
+        """put the cached body of entry at path, replacing whatever is already there"""
+        partial = path + '.cache'
+        if self.hard_links:
+            try:
+                if os.path.exists(partial): os.remove(partial)
+                os.link(entry.path, partial)
+                return os.replace(partial, path)
+            except OSError: pass  # across filesystems, fallback to copying
+
+        shutil.copyfile(entry.path, partial)
+        os.replace(partial, path)
+
+    def remove(self, url: str):
+        """drop url from the cache"""
+        self._forget(self._key(url))
+
+    def clear(self):
+        """drop every entry in the cache"""
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys: self._forget(key)
+
+    def _evict(self):
+        """forget the least recently used entries until the cache fits in max_size"""
+        while True:
+            with self._lock:
+                if self._size <= self.max_size or not self._entries:
+                    return
+                key = next(iter(self._entries))
+            self._forget(key)
+
+    def _forget(self, key):
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+
+        for suffix in (self.meta_suffix, self.body_suffix):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError: pass
+
+    def _load(self):
+        """index the entries already in directory, ordered by when they were last used"""
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.body_suffix):
+                continue
+
+            key = name[:-len(self.body_suffix)]
+            try:
+                stat = os.stat(self._path(key, self.body_suffix))
+            except OSError:
+                continue
+            if os.path.exists(self._path(key, self.meta_suffix)):
+                found.append((stat.st_mtime, key, stat.st_size))
+
+        for mtime, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
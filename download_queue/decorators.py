@@ -1,13 +1,69 @@
-import typing, functools, time
+import typing, functools, time, asyncio
 
-ROEArgument = typing.Union[typing.Tuple[str, int], int]  # ('', 5) or 5
+from .backoff import Backoff, ConstantBackoff, is_retryable, retry_after
 
-def repeat_on_error(repeat_count: ROEArgument, wait_on_failure: ROEArgument):
+ROEArgument = typing.Union[typing.Tuple[str, typing.Any], int, float]  # ('', 5) or 5
+
+class RetryLater(Exception):
+    """raised by `repeat_on_error` out of a downloader running in a download
+    queue, so the queue can retry it after delay seconds without a worker
+    thread (and a slot in the queue) sitting idle until then."""
+    def __init__(self, delay: float):
+        super().__init__(delay)
+        self.delay = delay
+
+def _parse_roe_arg(X): return (None, X) if not isinstance(X, (tuple, list)) else X
+
+def _extract_attr(self, identifier, default, *args):
+    # extract identifier from self if identifier was given & self has identifier as an attribute
+    return getattr(self, identifier) if identifier and hasattr(self, identifier) else default
+
+def _notify_retry(self):
+    handler = getattr(self, '_retry_handler', None)
+    if handler is not None: handler()
+
+def _log_final_failure(self, attempt_count):
+    self.logger.exception('failed to download after %03d attempts using %s with args: %s' % (
+        attempt_count, self.__class__.__name__, repr(self.serialise_args())[1:-1]
+    ))
+
+def _chain_error(error, previous):
+    """attach previous to the end of the context chain of error, so the traceback
+    of the final error includes every error encountered on every attempt."""
+    tail, seen = error, {id(error)}
+    while tail.__context__ is not None:
+        tail = tail.__context__
+        if id(tail) in seen or tail is previous: return  # already chained
+        seen.add(id(tail))
+    tail.__context__ = previous
+
+def _retry_delay(error, backoff, attempt, previous_delay):
+    """the delay before retrying after error, respecting any Retry-After header"""
+    delay  = max(backoff.delay(attempt, previous_delay), 0)
+    server = retry_after(error)
+    return delay if server is None else max(delay, server)
+
+def _resolve_backoff(self, backoff, attempt_delay):
+    backoff = _extract_attr(self, *backoff)
+    return backoff if isinstance(backoff, Backoff) else ConstantBackoff(attempt_delay)
+
+def repeat_on_error(repeat_count: ROEArgument, wait_on_failure: ROEArgument,
+                    backoff: ROEArgument = ('attempt_backoff', None),
+                    chain_errors: ROEArgument = ('attempt_chain_errors', True)):
     """runs a function and if an erorr is encountered, waits some interval
     and then reruns the function upto repeat_count times. If on the last
     attempt an error is again encountered, the function allows the exception
     to capture control flow.
 
+    Errors which retrying can't fix (see `download_queue.backoff.is_retryable`,
+    or a `_is_retryable` method on self) are raised straight away. When the
+    server sends a Retry-After header, at least that long is waited.
+
+    When self is being run by a download queue, instead of sleeping through the
+    wait the decorator raises `RetryLater`, which gives the slot of the download
+    back to the queue until the wait is over. The attempt count is kept on self
+    in the meantime.
+
     NOTE this decorator is exclusively for the use of `download_queue.Downloader`
 
     Parameters
@@ -23,49 +79,93 @@ def repeat_on_error(repeat_count: ROEArgument, wait_on_failure: ROEArgument):
         how long to wait after an exception has been encountered and before
         the next download attempt. this argument is parsed in the same way
         as repeat_count.
+    backoff
+        the :obj:`download_queue.backoff.Backoff` deciding how long to wait
+        between attempts, parsed in the same way as repeat_count. when it's
+        None, wait_on_failure is waited after every attempt.
+    chain_errors
+        when truthy, the error raised after the final attempt has the errors of
+        every earlier attempt chained onto it (as though each attempt was made
+        while handling the error of the one before). parsed in the same way as
+        repeat_count.
     """
-    parse_roe_arg = lambda X: (None, X) if isinstance(X, int) else X
-
-    def extract_attr(self, identifier, default, *args):
-        # extract identifier from self if identifier was given & self has identifier as an attribute
-        return getattr(self, identifier) if identifier and hasattr(self, identifier) else default
-
     def decorator(func):
-        _attempt_count = parse_roe_arg(repeat_count)
-        _attempt_delay = parse_roe_arg(wait_on_failure)
+        _attempt_count = _parse_roe_arg(repeat_count)
+        _attempt_delay = _parse_roe_arg(wait_on_failure)
+        _backoff       = _parse_roe_arg(backoff)
+        _chain_errors  = _parse_roe_arg(chain_errors)
 
         @functools.wraps(func)
         def wrapped(self, *args, **kwargs):
-            attempt_count = max(extract_attr(self, *_attempt_count), 1)
-            attempt_delay = max(extract_attr(self, *_attempt_delay), 0)
-
-            def recursively_invoke_func(attempt):
-                """recursively invokes the argument to this decorator
-                such that, if the worst should happen and every download
-                attempt failed, the resulting stacktrace will include every
-                error encountered on every attempt.
-
-                TODO This may not be the desired behaviour, consider adding
-                     an optional flag allowing a person to invoke the function
-                     non recursively.
-                NOTE this approach is verbose enough that raising a single
-                     exception expresses more than enough information about
-                     the request.
-                """
+            attempt_count = max(_extract_attr(self, *_attempt_count), 1)
+            attempt_delay = max(_extract_attr(self, *_attempt_delay), 0)
+            backoff       = _resolve_backoff(self, _backoff, attempt_delay)
+            chain         = _extract_attr(self, *_chain_errors)
+            retryable     = getattr(self, '_is_retryable', is_retryable)
+
+            # resume the count when a queue is retrying us after a RetryLater
+            attempt, previous, delay = getattr(self, '_retry_state', None) or (1, None, None)
+            self._retry_state = None
+
+            # NOTE attempts are made in a loop rather than recursively, so the
+            #      stack doesn't grow with attempt_count.
+            while True:
                 try:
                     return func(self, *args, **kwargs)
                 except KeyboardInterrupt: raise
-                except:  # pylint: disable=E722
-                    if attempt <= 0:
-                        self.logger.exception('failed to download after %03d attempts using %s with args: %s' % (
-                            attempt_count, self.__class__.__name__, repr(self.serialise_args())[1:-1]
-                        ))
+                except Exception as error:
+                    if chain and previous is not None:
+                        _chain_error(error, previous)
 
+                    if attempt >= attempt_count or not retryable(error):
+                        _log_final_failure(self, attempt)
                         raise
-                    else:
-                        time.sleep(attempt_delay)  # wait interval
-                        return recursively_invoke_func(attempt-1)
 
-            return recursively_invoke_func(attempt_count-1)
+                    delay = _retry_delay(error, backoff, attempt, delay)
+                    attempt, previous = attempt + 1, error
+                    _notify_retry(self)
+
+                    if getattr(self, '_defer_retries', False):
+                        self._retry_state = (attempt, previous, delay)
+                        raise RetryLater(delay)
+
+                time.sleep(delay)  # wait interval
+        return wrapped
+    return decorator
+
+def async_repeat_on_error(repeat_count: ROEArgument, wait_on_failure: ROEArgument,
+                          backoff: ROEArgument = ('attempt_backoff', None)):
+    """coroutine counterpart of `repeat_on_error`. the decorated coroutine
+    is awaited upto repeat_count times, sleeping on the event loop (rather
+    than blocking it) between attempts.
+
+    NOTE this decorator is exclusively for the use of `download_queue.aio.AsyncDownloader`
+    """
+    def decorator(func):
+        _attempt_count = _parse_roe_arg(repeat_count)
+        _attempt_delay = _parse_roe_arg(wait_on_failure)
+        _backoff       = _parse_roe_arg(backoff)
+
+        @functools.wraps(func)
+        async def wrapped(self, *args, **kwargs):
+            attempt_count = max(_extract_attr(self, *_attempt_count), 1)
+            attempt_delay = max(_extract_attr(self, *_attempt_delay), 0)
+            backoff       = _resolve_backoff(self, _backoff, attempt_delay)
+            retryable     = getattr(self, '_is_retryable', is_retryable)
+            delay         = None
+
+            for attempt in range(1, attempt_count + 1):
+                try:
+                    return await func(self, *args, **kwargs)
+                except (KeyboardInterrupt, asyncio.CancelledError): raise
+                except Exception as error:
+                    if attempt >= attempt_count or not retryable(error):
+                        _log_final_failure(self, attempt)
+                        raise
+
+                    delay = _retry_delay(error, backoff, attempt, delay)
+
+                _notify_retry(self)
+                await asyncio.sleep(delay)  # wait interval
         return wrapped
     return decorator
@@ -1,9 +1,16 @@
-import os, typing, io
-from threading import Thread
+import os, typing, io, time, shutil, hashlib, errno, threading
+from http.client import HTTPException, IncompleteRead
 from abc import ABCMeta, abstractmethod
-from requests import get as urlretrieve
+from urllib.parse import urlsplit
+from requests import request as urlrequest
+from requests.models import PreparedRequest
+from requests.exceptions import ChunkedEncodingError, RequestException, ConnectionError as RequestsConnectionError
 
-from .decorators import repeat_on_error
+from .backoff import is_retryable
+from .buffers import SpillBuffer
+from .pipeline import TransformType, make_transforms, transform_chunks
+from .decorators import repeat_on_error, RetryLater
+from .limits import bandwidth_bucket
 
 DEFAULT_HEADERS = {
     # you almost always don't want who your downloading from to think you're a bot. If you disagree, pass headers={'User-Agent':None}
@@ -11,10 +18,12 @@ DEFAULT_HEADERS = {
 }
 
 
-class Downloader(Thread, metaclass=ABCMeta):
+class Downloader(metaclass=ABCMeta):
     def __init__(self, download_queue, **kwargs):
         """Downloader object which completes a network request
-        concurrently and stores the response to a file like object.
+        and stores the response to a file like object. Downloaders
+        are jobs, they're run concurrently by the worker threads of
+        the download queue they were added to.
 
         Parameters
         ----------
@@ -37,7 +46,9 @@ class Downloader(Thread, metaclass=ABCMeta):
                 session : :obj:`requests.Session`
                     if given all the above attributes are first
                     extracted from the session instance and then
-                    overriden with the above arguments.
+                    overriden with the above arguments. requests
+                    are then sent through this session, instead of
+                    through the session pool of the download queue.
                 completion_hook : Callable
                     function which will be called once download
                     has finished. function will be called with
@@ -48,20 +59,22 @@ class Downloader(Thread, metaclass=ABCMeta):
                 block_on_error : :obj:`bool`
                     defaults to False. when true, if the attempted
                     download fails and raises an exception, that
-                    exception will be allowed to gain top level
-                    control of the running thread. This is almost
-                    never what you'd want to happen.
-                    from the file system.
+                    exception will be reraised out of download. The
+                    queues worker threads log and then swallow it, so
+                    this is almost never what you'd want to happen.
+                bandwidth : :obj:`float`
+                    the most bytes per second this download may
+                    receive, on top of the bandwidth limit of the
+                    download queue. see `Downloader.bandwidth`.
         """
-        super().__init__(target=self.download, daemon=True)
-
         self.queue = download_queue
         self.headers = DEFAULT_HEADERS.copy()
         self.params  = {}
         self.cookies = {}  # TODO keep as cookiejar
+        self.session = kwargs.pop('session', None)
 
-        if 'session' in kwargs:
-            self._assign_params_from_session(kwargs.pop('session'))
+        if self.session is not None:
+            self._assign_params_from_session(self.session)
 
         self.headers.update(kwargs.pop('headers', {}))
         self.headers.update(kwargs.pop('cookies', {}))
@@ -70,9 +83,17 @@ class Downloader(Thread, metaclass=ABCMeta):
         self.chunk_size       = kwargs.pop('chunk_size', 2 ** 10)  # default=1MB
         self.comhook          = kwargs.pop('completion_hook', None)
         self.block_on_error   = kwargs.pop('block_on_error', False)
-
-        self.begin    = self.start
-        self.complete = False
+        self._bandwidth       = None
+        self.bandwidth        = kwargs.pop('bandwidth', None)
+
+        self.complete       = False
+        self.error          = None  # exception which caused the download to fail
+        self.future         = None  # set by the download queue, see `DownloadQueue.add`
+        self.bytes_received = 0
+        self.queued_at      = None  # time.monotonic() when added to the download queue
+        self.started_at     = None  # time.monotonic() when the download started
+        self.finished_at    = None
+        self.processed      = None  # what the post processor of the queue returned, see `DownloadQueue`
 
         if len(kwargs) > 0:  # unremoved keyword arguments exist
             raise ValueError("%s received unexpected keyword arguments: %s" % (
@@ -85,12 +106,33 @@ class Downloader(Thread, metaclass=ABCMeta):
 
         self.logger.debug('attempting to download: %s' % (repr(self.serialise_args())[1:-1]))
 
+        metrics = self.metrics
+        if self.started_at is None:  # not being retried by the queue
+            self.started_at = time.monotonic()
+            if metrics is not None: metrics.started(self)
+
+        # let repeat_on_error hand retries back to the queue, instead of sleeping,
+        # when the downloader was added to (and is being run by) the queue.
+        self._defer_retries = self.future is not None and hasattr(self.queue, '_reschedule')
+        rescheduled         = False
+
         try:
             self._download()
-        except (KeyboardInterrupt, Exception) as e: self._error_handler(e)
-        else:                                       self._pass_handler()
+        except RetryLater as retry:
+            rescheduled = True
+            self.queue._reschedule(self, retry.delay)
+        except (KeyboardInterrupt, Exception) as e:
+            self.error = e
+            self._error_handler(e)
+        else:
+            self._pass_handler()
         finally:
-            if self.comhook: self.comhook(self)  # XXX code smell
+            self._defer_retries = False
+
+            if not rescheduled:
+                self.finished_at = time.monotonic()
+                if metrics is not None: metrics.finished(self)
+                if self.comhook: self.comhook(self)  # XXX code smell
 
     def _error_handler(self, e):
         if self.block_on_error:
@@ -99,9 +141,75 @@ class Downloader(Thread, metaclass=ABCMeta):
     def _pass_handler(self):
         self.complete = True
 
+    def _is_retryable(self, error):
+        """whether retrying could fix error, see `download_queue.backoff.is_retryable`"""
+        return is_retryable(error)
+
+    def _retry_handler(self):
+        """invoked by `repeat_on_error` before a failed attempt is retried"""
+        metrics = self.metrics
+        if metrics is not None: metrics.retried(self)
+
     @property
     def logger(self): return self.queue.logger
 
+    @property
+    def metrics(self):
+        """the :obj:`download_queue.QueueStats` of the download queue, if it has one"""
+        return getattr(self.queue, 'metrics', None)
+
+    @property
+    def host(self):
+        """the host this downloader connects to, used to apply per host limits.
+        None when the downloader doesn't connect to any one host."""
+        return None
+
+    @property
+    def dedupe_key(self):
+        """hashable key identifying the response this downloader fetches. the
+        download queue merges downloads with the same key, which are running at
+        the same time, into one. None when the download can't be merged."""
+        return None
+
+    @property
+    def bandwidth(self) -> typing.Optional[float]:
+        """the most bytes per second this download may receive, None for no limit.
+        can be changed while the download is running."""
+        return self._bandwidth.rate if self._bandwidth is not None else None
+
+    @bandwidth.setter
+    def bandwidth(self, rate):
+        self._bandwidth = bandwidth_bucket(self._bandwidth, rate)
+
+    def _count_bytes(self, count):
+        """record that count more bytes of the response have been received"""
+        self.bytes_received += count
+        metrics = self.metrics
+        if metrics is not None: metrics.received(self, count)
+
+    def _throttle(self, count):
+        """block until count more bytes can be received without exceeding the
+        bandwidth limit of this download or of the download queue"""
+        for bucket in (self._bandwidth, getattr(self.queue, '_bandwidth', None)):
+            if bucket is not None: bucket.throttle(count)
+
+    def _request(self, method, url, **kwargs):
+        """send a request through the session given to this downloader, the
+        session pool of the download queue or, without either, a throwaway
+        connection. see `requests.request`."""
+        sessions = getattr(self.queue, 'sessions', None)
+        if self.session is not None:
+            response = self.session.request(method, url, **kwargs)
+        elif sessions is not None:
+            response = sessions.request(method, url, **kwargs)
+        else:
+            response = urlrequest(method, url, **kwargs)
+
+        metrics = self.metrics
+        if metrics is not None:  # time until the response headers arrived
+            metrics.responded(self, response.elapsed.total_seconds())
+        return response
+
     @abstractmethod
     def serialise_args(self):
         """primmed arguments list to be used by the logger should download fail"""
@@ -122,12 +230,22 @@ FileType = typing.Union[str, io.FileIO]
 
 
 class GenericDownloader(Downloader):
+    partial_suffix   = '.part'      # appended to destination paths when streaming
+    validator_suffix = '.part.meta' # holds the validator of a partial file between runs
+    mark_interval    = 0.5          # seconds between saves of how much of a preallocated partial file was received
+
     def __init__(self, download_queue,
                  link:                     str,
                  dest:                     FileType,
                  close_fd:                 bool = True,
                  delete_failed_fd:         bool = False,
                  overwrite_existing_files: bool = False,
+                 stream:                   bool = False,
+                 resume:                   bool = True,
+                 cache                         = None,
+                 verify:                   typing.Optional[typing.Dict[str, typing.Union[str, int]]] = None,
+                 hashes:                   typing.Iterable[str] = (),
+                 transforms:               typing.Sequence[TransformType] = (),
                  **kwargs):
         """Generic Downloader to act as default for download_queue.
         This downloader attempts to provide a straightforward and
@@ -159,6 +277,53 @@ class GenericDownloader(Downloader):
             when a string is passed as destination (implying we need to
             open the file for writing) if the file already exists, it
             will be overwritten. This defaults to False.
+        stream
+            when truthy, response chunks are written out as they arrive
+            instead of being buffered in memory until the download has
+            finished. If dest is a path, chunks are written to a partial
+            file beside it (dest + `partial_suffix`) which is atomically
+            renamed to dest once the download succeeds, otherwise they're
+            written straight to the given file like object. Peak memory
+            usage per download is then roughly `chunk_size`.
+        resume
+            when truthy, a retry after a failed attempt requests only the
+            bytes that haven't been received yet (using a Range request
+            guarded by If-Range) instead of the whole response again. if
+            the server doesn't honour the range, the download restarts
+            from the beginning. When streaming to a path, the validator of
+            the partial file is stored beside it (dest + `validator_suffix`)
+            so a later process can resume the download as well, along with
+            how much of it was received while it's preallocated.
+
+            NOTE resuming requires the server to send a strong ETag or a
+                 Last-Modified header, without either attempts restart.
+        cache
+            the :obj:`download_queue.ResponseCache` used to avoid downloading
+            responses which haven't changed since they were last downloaded.
+            defaults to the cache of the download queue, pass False to not use
+            a cache at all.
+        verify
+            the digests the response must have, a mapping of hashlib algorithm
+            names (eg. 'sha256' or 'md5') to hex digests. a 'size' key gives
+            the length of the response in bytes. digests are computed as each
+            chunk arrives, and a response which doesn't match fails with an
+            `IntegrityError`, which is retried like any other error.
+        hashes
+            the names of hashlib algorithms to compute digests with, alongside
+            those in verify. once the download completes, the digests are found
+            in the digests attribute of the downloader.
+
+            NOTE when resuming, the bytes already received are read back to be
+                 hashed, and `SegmentedDownloader` reads back the whole file.
+        transforms
+            stages the response is passed through, chunk by chunk, as it's
+            received, before it's written to dest. each is either the name of
+            a transform in `download_queue.pipeline.TRANSFORMS`, such as 'gzip',
+            or a callable returning a :obj:`download_queue.pipeline.Transform`.
+            verify and hashes apply to the response before it's transformed.
+
+            NOTE transformed downloads restart from the beginning instead of
+                 resuming, and are neither cached nor merged with other downloads.
 
         """
         self.link                      = link
@@ -166,54 +331,492 @@ class GenericDownloader(Downloader):
         self._close_fd                 = close_fd
         self._delete_failed_fd         = delete_failed_fd
         self._overwrite_existing_files = overwrite_existing_files
-        self._download_buffer          = io.BytesIO()
+        self._stream                   = stream
+        self._resume                   = resume
+        self._validator                = None  # ETag or Last-Modified of the partial response
+        self._partial_fd               = None
+        self._stream_started           = False
+        self._download_buffer          = SpillBuffer(getattr(download_queue, 'memory', None))
         self._download_buffer_complete = False
-
-        # optional member attributes
-        if 'attempt_count' in kwargs:    self.attempt_count    = kwargs.pop('attempt_count')
-        if 'attempt_interval' in kwargs: self.attempt_interval = kwargs.pop('attempt_interval')
+        self._cache                    = getattr(download_queue, 'cache', None) if cache is None else cache or None
+        self._cache_entry              = None  # entry of the cache for link, when there's one
+        self._entity                   = (None, None)  # ETag and Last-Modified of the response
+        self._body_path                = None  # path the received body can be read back from
+        self._source                   = None  # download this one was merged with, see `DownloadQueue.add`
+        self._verify                   = dict(verify or {})
+        self._expected_size            = self._verify.pop('size', None)
+        self._hash_names               = sorted(set(hashes) | set(self._verify))
+        self._hashing                  = bool(self._hash_names) or self._expected_size is not None
+        self.digests                   = {}  # hex digest of the response for each algorithm, once received
+        self._reset_hashers()  # NOTE also rejects unknown algorithms
+        self._transforms               = list(transforms)
+        make_transforms(self._transforms)  # reject unknown transforms straight away
+        if self._transforms:
+            self._cache = None  # the cache holds responses, not what they're transformed into
+
+        # optional member attributes, see `download_queue.decorators.repeat_on_error`
+        if 'attempt_count' in kwargs:        self.attempt_count        = kwargs.pop('attempt_count')
+        if 'attempt_interval' in kwargs:     self.attempt_interval     = kwargs.pop('attempt_interval')
+        if 'attempt_backoff' in kwargs:      self.attempt_backoff      = kwargs.pop('attempt_backoff')
+        if 'attempt_chain_errors' in kwargs: self.attempt_chain_errors = kwargs.pop('attempt_chain_errors')
 
         super().__init__(download_queue, **kwargs)
 
     def __del__(self):
         self._download_buffer.close()
 
-    @repeat_on_error(('attempt_count', 10), ('attempt_interval', 3))
+    def download(self):
+        queued = self.future is not None
+        super().download()
+        # NOTE a download the queue rescheduled hasn't finished, and one which failed
+        #      outside of the queue keeps what it received for its caller to inspect.
+        if self.complete or (queued and self.finished_at is not None):
+            # NOTE the buffer is only freed once the completion hook has returned,
+            #      so the downloads merged into this one can still copy it.
+            self._download_buffer.close()
+            self._download_buffer_complete = False
+
     def _download(self):
+        """download the response, or copy it from the download it was merged with"""
+        if self._source is not None:
+            return self._copy_from(self._source)
+        return self._fetch()
+
+    @repeat_on_error(('attempt_count', 10), ('attempt_interval', 3))
+    def _fetch(self):
+        """download the response, or restore it from the cache if it hasn't changed"""
+        try:
+            self._fetch_response()
+        except _NotModified:
+            self._restore_cached()
+        else:
+            self._store_cached()
+
+    def _fetch_response(self):
         """read response into buffer and then dump to file, before closing"""
+        if self._stream:
+            return self._stream_download()
+
         if not self._download_buffer_complete:
             # downloaded data doesn't exist in memory yet.
-            try:
-                for chunk in self._iterate_response_chunks():
-                    self._download_buffer.write(chunk)
+            # NOTE on failure the buffer is left positioned after the last byte
+            #      received, so the next attempt can resume from there.
+            self._receive(self._download_buffer)
+            self._check_digests()
+            self._download_buffer.flush()  # a spilled buffer is read back from its path
+            self._download_buffer_complete = True
+
+        # NOTE the whole body is written again when a previous write failed
+        #      part way, and it's written straight from the buffer (or the file
+        #      it spilled to) without copying it first.
+        body = self._body()
+        try:
+            self._write_body(body)
+        finally:
+            if isinstance(body, memoryview): body.release()
 
-                self._download_buffer_complete = True
-            finally:
-                # if succeeded, return to start for following write operation. If
-                # failed, return to start so on next attempt, existing data in the
-                # buffer is overwritten.
-                self._download_buffer.seek(0)
+    def _stream_download(self):
+        """write response chunks to the destination as they arrive, moving
+        the partial file into place when the destination is a path."""
+        destination = self._get_stream_fd()
+        self._receive(destination)
+        self._check_digests()
 
-        destination = self._get_dest_fd()
+        if destination is self._partial_fd:
+            destination.close()
+            os.replace(destination.name, self.destination)  # atomic on the same filesystem
+            self._partial_fd = None
+            self._body_path  = self.destination
+            self._remove_validator()
+        elif self._close_fd:
+            destination.close()
 
-        # NOTE leave seek op here in case a previous write failed and some of the
-        #      buffer was written, but some wasn't. it should have no performance
-        #      cost if the file is at it's start position already.
+    def _receive(self, sink):
+        """write the response body to sink. when resuming, the bytes before the
+        current position of sink are assumed to have already been received."""
+        offset = sink.tell() if self._resume and self._validator and not self._transforms else 0
+        if self._hashing and offset != self._hashed:
+            offset = self._rehash(sink, offset)
+
+        response = self._open_response(offset)
+        start    = self._response_start(response, offset)
+
+        sink.seek(start)
+        sink.truncate()  # discard anything the server isn't resending
+
+        length = response.headers.get('Content-Length', '')
+        preallocated = (sink is self._partial_fd and response.status_code in (200, 206) and length.isdigit()
+                        and not self._transforms and _preallocate(sink, start + int(length)))
+        if preallocated:
+            # NOTE the partial file is as long as the whole response until it's been
+            #      received, so a later run resumes from the bytes marked as received
+            #      alongside the validator rather than from its end.
+            self._save_validator(start)
+
+        chunks = self._iterate_response_chunks(response)
+        if self._hashing:
+            if start != self._hashed:
+                self._reset_hashers()  # restarting from the beginning
+            chunks = self._hash_chunks(chunks)
+        if self._transforms:
+            chunks = transform_chunks(chunks, make_transforms(self._transforms))
+        if preallocated:
+            chunks = self._mark_received(chunks, sink)
+
+        try:
+            for chunk in chunks:
+                sink.write(chunk)
+        finally:
+            if preallocated:
+                sink.truncate()  # drop the space reserved for bytes which never arrived
+                self._save_validator()
+
+    def _mark_received(self, chunks, sink):
+        """pass on chunks, every `mark_interval` seconds saving how much of the
+        preallocated sink they've filled, so a killed run can be resumed"""
+        marked = time.monotonic()
+        for chunk in chunks:
+            if time.monotonic() - marked >= self.mark_interval:
+                sink.flush()  # every chunk passed on so far has been written
+                self._save_validator(sink.tell())
+                marked = time.monotonic()
+            yield chunk
+
+    def _reset_hashers(self):
+        self._hashers = [hashlib.new(X) for X in self._hash_names]
+        self._hashed  = 0  # bytes passed to the hashers
+
+    def _hash(self, data):
+        for hasher in self._hashers: hasher.update(data)
+        self._hashed += len(data)
+
+    def _hash_chunks(self, chunks):
+        for chunk in chunks:
+            self._hash(chunk)
+            yield chunk
+
+    def _rehash(self, sink, offset):
+        """hash the first offset bytes of sink, received by an earlier attempt
+        (or process). returns the offset to resume from, which is 0 when sink
+        can't be read back."""
+        self._reset_hashers()
+        try:
+            sink.seek(0)
+            while self._hashed < offset:
+                block = sink.read(min(offset - self._hashed, 2 ** 20))
+                if not block: break
+                self._hash(block)
+        except (io.UnsupportedOperation, OSError):
+            self._reset_hashers()
+        return self._hashed
+
+    def _hash_body(self, body):
+        """hash the whole of body, a path or bytes like object"""
+        self._reset_hashers()
+        if not isinstance(body, str):
+            return self._hash(body)
+
+        with open(body, 'rb') as fd:
+            for block in iter(lambda: fd.read(2 ** 20), b''):
+                self._hash(block)
+
+    def _check_digests(self):
+        """record the digests of the response received, raising an IntegrityError
+        (after discarding the response) when they aren't the ones expected."""
+        if not self._hashing:
+            return
+
+        self.digests = {X: Y.hexdigest() for X, Y in zip(self._hash_names, self._hashers)}
+        if self._expected_size is not None and self._hashed != self._expected_size:
+            problem = 'is %d bytes, expected %d' % (self._hashed, self._expected_size)
+        else:
+            wrong = [X for X, Y in self._verify.items() if self.digests[X] != Y.lower()]
+            if not wrong:
+                return
+            problem = 'has %s %s, expected %s' % (wrong[0], self.digests[wrong[0]], self._verify[wrong[0]])
+
+        self._discard_received()
+        raise IntegrityError('response of %s %s' % (self.link, problem))
+
+    def _discard_received(self):
+        """forget the response received so far, so the next attempt starts again"""
+        self._set_validator(None)
+        self._reset_hashers()
         self._download_buffer.seek(0)
+        self._download_buffer.truncate()
+        if self._partial_fd is not None:
+            self._partial_fd.seek(0)
+            self._partial_fd.truncate()
+
+    def _open_response(self, offset=0):
+        """make request for the response body from offset onwards"""
+        headers = self.headers
+        if offset:
+            headers = dict(headers, **{'Range': 'bytes=%d-' % offset, 'If-Range': self._validator})
+        elif self._cache is not None:
+            headers = self._conditional_headers(headers)
+
+        response = self._request('GET', self.link, headers=headers, params=self.params,
+                                 cookies=self.cookies, stream=True)
+
+        if response.status_code == 304 and self._cache_entry is not None:
+            response.close()
+            raise _NotModified(self.link)
+
+        if response.status_code != 416 and not response.ok:  # 416 is handled by _response_start
+            response.close()  # give back the connection, the error shouldn't hold on to it
+            response.raise_for_status()
+        # TODO delegate request validation to caller
 
-        destination.write(self._download_buffer.read())
-        if self._close_fd:  # also flushes file
-            destination.close()
+        if response.status_code in (200, 206):
+            self._set_validator(_response_validator(response))
+            self._entity = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response
 
-    def _iterate_response_chunks(self):
-        """make request and yield response chunks"""
-        request_response = urlretrieve(self.link, headers=self.headers, cookies=self.cookies, stream=True)
+    @property
+    def _cache_url(self):
+        """the url responses are cached under, link including its params"""
+        request = PreparedRequest()
+        request.prepare_url(self.link, self.params)
+        return request.url
+
+    def _conditional_headers(self, headers):
+        """add the validators of the cached response, if any, to headers"""
+        self._cache_entry = entry = self._cache.lookup(self._cache_url)
+        if entry is None:
+            return headers
+
+        headers = dict(headers)
+        if entry.etag:          headers['If-None-Match']     = entry.etag
+        if entry.last_modified: headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def _restore_cached(self):
+        """write the cached body to the destination, after the server said it hasn't changed"""
+        if self._partial_fd is not None:  # nothing was written to it
+            self._partial_fd.close()
+            os.remove(self._partial_fd.name)
+            self._partial_fd = None
+
+        if self._hashing:
+            self._hash_body(self._cache_entry.path)
+            try:
+                self._check_digests()
+            except IntegrityError:
+                self._cache.remove(self._cache_url)  # so the next attempt downloads it
+                raise
 
-        request_response.raise_for_status()  # only accept 200
-        # TODO delegate request validation to caller
+        if isinstance(self.destination, str):
+            if not self._overwrite_existing_files and os.path.exists(self.destination):
+                raise FileExistsError(self.destination)
 
-        for chunk in request_response.iter_content(self.chunk_size):
-            if chunk: yield chunk  # generate valid chunks
+            self._cache.restore(self._cache_entry, self.destination)
+            self._body_path = self.destination
+        else:
+            self._write_body(self._cache_entry.path)
+            self._body_path = self._cache_entry.path
+
+    def _store_cached(self):
+        """add the response just received to the cache, when it can be revalidated"""
+        etag, last_modified = self._entity
+        if self._cache is None or not (etag or last_modified):
+            return
+
+        body = self._body()
+        if body is None:
+            return
+
+        try:
+            self._cache.store(self._cache_url, body, etag, last_modified)
+        except OSError as e:  # the download itself succeeded
+            self.logger.warning('failed to cache %s: %s' % (self.link, e))
+        finally:
+            if isinstance(body, memoryview): body.release()
+
+    def _body(self):
+        """the body received by this downloader, as a path to it or a memoryview
+        of it. None when it was streamed somewhere it can't be read back from."""
+        if self._body_path is not None:
+            return self._body_path
+        if self._download_buffer_complete:
+            return self._download_buffer.path or self._download_buffer.getbuffer()
+        return None
+
+    def _copy_from(self, source):
+        """write the body received by source, the download this one was merged
+        with, to the destination. when source failed to fetch the response this
+        fails with the same error. when it failed for its own reasons (such as
+        its destination existing or its digests not matching) the body is still
+        copied, if it was received, and otherwise fetched again by this download."""
+        body = source._body()
+        if body is None and not source.complete:
+            if isinstance(source.error, (RequestException, HTTPException)):
+                raise source.error  # the response couldn't be fetched
+
+            self._source = None
+            raise RetryLater(0)  # fetch it on its own
+
+        if body is None:
+            raise IOError('body of merged download of %s is unavailable' % self.link)
+
+        try:
+            if self._hashing:
+                self._hash_body(body)
+                self._check_digests()
+
+            if isinstance(self.destination, str):
+                if not self._overwrite_existing_files and os.path.exists(self.destination):
+                    raise FileExistsError(self.destination)
+
+                partial_path = self.destination + self.partial_suffix
+                if isinstance(body, str):
+                    shutil.copyfile(body, partial_path)
+                else:
+                    with open(partial_path, 'wb') as fd: fd.write(body)
+                os.replace(partial_path, self.destination)
+                self._body_path = self.destination
+            else:
+                self._write_body(body)
+        finally:
+            if isinstance(body, memoryview): body.release()
+
+    def _write_body(self, body):
+        """write body, a path or bytes like object, to the file like destination"""
+        destination = self._get_dest_fd()
+        if isinstance(body, str):
+            with open(body, 'rb') as fd:
+                shutil.copyfileobj(fd, destination)
+        else:
+            destination.write(body)
+
+        if self._close_fd:  # also flushes file
+            destination.close()
+
+    def _response_start(self, response, offset):
+        """find the offset of the first byte in the body of response"""
+        if response.status_code == 206:
+            start, total = _parse_content_range(response.headers.get('Content-Range', ''))
+            if start != offset:
+                raise IOError('server resumed %s from byte %s, expected %d' % (self.link, start, offset))
+            return start
+
+        if response.status_code == 416:
+            # range starts at or after the end of the file, which is complete
+            # when its length matches the bytes already received.
+            start, total = _parse_content_range(response.headers.get('Content-Range', ''))
+            if total != offset:
+                response.raise_for_status()
+            return offset
+
+        return 0  # full response, restart from the beginning
+
+    def _iterate_response_chunks(self, response=None):
+        """yield chunks of the response body, making the request if no response is given.
+
+        NOTE when the body can be read straight from the socket, see `_readinto_source`,
+             chunks are views of a buffer which is reused for the next chunk, so they
+             must be written out (or copied) before asking for another.
+        """
+        if response is None:
+            response = self._open_response()
+
+        metrics = self.metrics
+        if response.status_code == 416:
+            return  # nothing left to receive
+
+        source = self._readinto_source(response)
+        if source is not None:
+            chunks = self._readinto_chunks(response, source)
+        else:
+            chunks = (X for X in response.iter_content(self.chunk_size) if X)  # generate valid chunks
+
+        if metrics is None or not metrics.chunk_timing:
+            for chunk in chunks:
+                self._count_bytes(len(chunk))
+                self._throttle(len(chunk))
+                yield chunk
+            return
+
+        # NOTE the clock restarts after each yield, so time spent by the caller
+        #      handling a chunk isn't counted as time spent reading the next one.
+        started = time.monotonic()
+        for chunk in chunks:
+            metrics.chunk(self, time.monotonic() - started)
+            self._count_bytes(len(chunk))
+            self._throttle(len(chunk))
+            yield chunk
+            started = time.monotonic()
+
+    def _readinto_source(self, response):
+        """the http.client response the body of response can be read from with
+        readinto, bypassing the copies and allocations made by requests for every
+        chunk. None when requests has to read it, because its length isn't known or
+        it has to be decoded."""
+        source = getattr(response.raw, '_fp', None)
+        if (response.status_code not in (200, 206) or not hasattr(source, 'readinto')
+                or response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+                or not response.headers.get('Content-Length', '').isdigit()):
+            return None
+        return source
+
+    def _readinto_chunks(self, response, source):
+        """yield views of the read buffer of this thread, filled from source"""
+        buffer    = _read_buffer(self.chunk_size)
+        remaining = int(response.headers['Content-Length'])
+        try:
+            while remaining > 0:
+                count = source.readinto(buffer)
+                if not count:  # NOTE readinto doesn't raise when the connection closes early
+                    raise IncompleteRead(b'', remaining)
+                remaining -= count
+                yield buffer[:count]
+        except HTTPException as e:  # raise the errors requests would've
+            raise ChunkedEncodingError(e) from e
+        except TimeoutError as e:
+            raise RequestsConnectionError(e) from e
+
+        response.raw.release_conn()  # body fully read, the connection can be reused
+
+    def _set_validator(self, validator):
+        if validator == self._validator:
+            return
+        self._validator = validator
+
+        if self._partial_fd is not None and self._resume:
+            if validator is None:
+                self._remove_validator()
+            else:
+                self._save_validator()
+
+    def _save_validator(self, received=None):
+        """save the validator of the partial file and, when it's been preallocated,
+        the bytes of it which have been received. the file is replaced at once so
+        a run killed part way through writing it never leaves half of it behind."""
+        if self._validator is not None and self._partial_fd is not None and self._resume:
+            path = self.destination + self.validator_suffix
+            with open(path + '.tmp', 'w') as fd:
+                fd.write(self._validator if received is None else '%s\n%d' % (self._validator, received))
+            os.replace(path + '.tmp', path)
+
+    def _load_validator(self):
+        """the validator and received bytes saved by `_save_validator`, received
+        is None when the whole partial file was received."""
+        try:
+            with open(self.destination + self.validator_suffix, 'r') as fd:
+                lines = fd.read().splitlines()
+        except OSError:
+            return None, None
+
+        validator = lines[0].strip() if lines else ''
+        received  = lines[1].strip() if len(lines) > 1 else ''
+        if not validator or (received and not received.isdigit()):
+            return None, None
+        return validator, int(received) if received else None
+
+    def _remove_validator(self):
+        try:
+            os.remove(self.destination + self.validator_suffix)
+        except OSError: pass
 
     def _get_dest_fd(self):
         """get file like object to write to. Also repositions cursor at start of file"""
@@ -227,7 +830,54 @@ class GenericDownloader(Downloader):
         self.destination.seek(0)
         return self.destination
 
+    def _get_stream_fd(self):
+        """get file like object to stream to. when destination is a path this
+        is the partial file, which is reopened, from the end, if it was left
+        behind by an earlier download we can resume. a preallocated partial file
+        is cut back to the bytes marked as received instead."""
+        if not isinstance(self.destination, str):
+            if self._stream_started:
+                return self.destination  # keep position for resuming
+
+            self._stream_started = True
+            return self._get_dest_fd()
+
+        if not self._overwrite_existing_files and os.path.exists(self.destination):
+            raise FileExistsError(self.destination)
+
+        if self._partial_fd is None:
+            partial_path = self.destination + self.partial_suffix
+            validator, received = self._load_validator() if self._resume else (None, None)
+
+            if validator and os.path.exists(partial_path):
+                self._validator  = validator
+                self._partial_fd = open(partial_path, 'r+b')
+                if received is None:
+                    self._partial_fd.seek(0, os.SEEK_END)
+                else:
+                    self._partial_fd.seek(min(received, os.fstat(self._partial_fd.fileno()).st_size))
+                    self._partial_fd.truncate()
+            else:
+                self._validator  = None
+                self._partial_fd = open(partial_path, 'w+b')
+                self._remove_validator()
+
+        return self._partial_fd
+
     def _error_handler(self, error):
+        if self._partial_fd is not None:
+            # NOTE the partial file is left behind unless it should be deleted.
+            name = self._partial_fd.name
+            self._partial_fd.close()
+            self._partial_fd = None
+
+            if self._delete_failed_fd:
+                self._remove_validator()
+
+                try:
+                    os.remove(name)
+                except OSError: pass
+
         if self._delete_failed_fd and hasattr(self.destination, 'name'):
             name = self.destination.name
             self.destination.close()
@@ -238,5 +888,77 @@ class GenericDownloader(Downloader):
 
         super()._error_handler(error)
 
+    @property
+    def host(self):
+        return urlsplit(self.link).hostname
+
+    @property
+    def dedupe_key(self):
+        if self.session is not None or (self._stream and not isinstance(self.destination, str)) or self._transforms:
+            return None  # unknown session state or a body which can't be read back
+
+        return (self._cache_url, tuple(sorted(self.headers.items(), key=str)),
+                tuple(sorted(self.cookies.items(), key=str)))
+
     def serialise_args(self):
         return [self.link, self.destination.name if hasattr(self.destination, 'name') else self.destination]
+
+
+_read_buffers = threading.local()
+
+
+def _read_buffer(size):
+    """a view of a buffer of size bytes reused by every download on the calling thread"""
+    buffer = getattr(_read_buffers, 'buffer', None)
+    if buffer is None or len(buffer) < size:
+        buffer = _read_buffers.buffer = bytearray(size)
+    return memoryview(buffer)[:size]
+
+
+def _preallocate(fd, size):
+    """reserve disk space for the file fd to grow to size bytes, extending it, so
+    it's written contiguously and a full disk fails straight away. returns whether
+    it was reserved, which isn't possible on every platform and filesystem."""
+    if not hasattr(os, 'posix_fallocate'):
+        return False
+
+    position = fd.tell()
+    if size <= position:
+        return False
+
+    fd.flush()
+    try:
+        os.posix_fallocate(fd.fileno(), position, size - position)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        return False
+    return True
+
+
+class IntegrityError(IOError):
+    """raised when the response received doesn't have the digests or size expected"""
+
+
+class _NotModified(Exception):
+    """raised when the server answers a conditional request with 304 Not Modified"""
+
+
+def _response_validator(response):
+    """get the value to send as If-Range when resuming response. weak
+    ETags can't be used for range requests, so they're ignored."""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+def _parse_content_range(value):
+    """parse a Content-Range header such as 'bytes 10-99/100' or 'bytes */100'
+    into the start offset and total length (None when unknown)."""
+    try:
+        unit, spec  = value.split(' ', 1)
+        span, total = spec.split('/', 1)
+        start       = None if span == '*' else int(span.split('-', 1)[0])
+        return start, None if total == '*' else int(total)
+    except ValueError:
+        raise IOError('invalid Content-Range header: %r' % value)
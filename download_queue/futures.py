@@ -0,0 +1,42 @@
+import time, typing
+from concurrent.futures import Future
+
+
+class DownloadFuture(Future):
+    """handle on a download added to a `download_queue.DownloadQueue`.
+
+    This is a `concurrent.futures.Future`, so it can be waited on, given done
+    callbacks or passed to `concurrent.futures.wait`/`as_completed`. Its result
+    is the downloader once the download has succeeded, and its exception is the
+    error which caused the download to fail. Cancelling the future before the
+    download has started stops it from ever being started.
+
+    When the download queue post processes downloads, the future is only done
+    once the download has been processed, see its processed attribute.
+    """
+    def __init__(self, downloader):
+        super().__init__()
+        self.downloader = downloader
+
+    def __repr__(self):
+        return '<%s at %s state=%s args=%r>' % (
+            self.__class__.__name__, hex(id(self)), self._state.lower(), self.downloader.serialise_args())
+
+    @property
+    def bytes_transferred(self) -> int:
+        """the number of response bytes received so far, including failed attempts"""
+        return self.downloader.bytes_received
+
+    @property
+    def processed(self):
+        """what the post processor returned for the download, None until it has been processed"""
+        return self.downloader.processed
+
+    @property
+    def elapsed(self) -> typing.Optional[float]:
+        """seconds the download has been running for, or ran for once finished.
+        None until the download has started."""
+        started, finished = self.downloader.started_at, self.downloader.finished_at
+        if started is None:
+            return None
+        return (finished if finished is not None else time.monotonic()) - started
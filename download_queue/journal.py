@@ -0,0 +1,172 @@
+import hashlib, importlib, json, sqlite3, threading, time, typing
+
+PENDING, ACTIVE, DONE, FAILED, CANCELLED = 'pending', 'active', 'done', 'failed', 'cancelled'
+UNFINISHED = (PENDING, ACTIVE)  # states of jobs a restarted queue runs again
+
+
+class Journal(object):
+    """persistent record of the downloads added to a download queue, kept in a
+    sqlite database so a queue restarted after a crash can carry on from where
+    the last one stopped. see the journal argument of `download_queue.DownloadQueue`.
+
+    every job is recorded with the arguments it was added with and its state,
+    pending, active, done, failed or cancelled, alongside the bytes it received
+    and the error it failed with. the state of every job is also kept in memory,
+    and changes are written to the database in batches by a background thread,
+    at most flush_interval seconds (or batch_size changes) after they're made.
+
+    NOTE only jobs whose arguments can be serialised as json are journaled, and
+         changes made in the last flush_interval seconds before a crash are lost.
+
+    Parameters
+    ----------
+    path
+        the sqlite database the journal is kept in, created when it doesn't exist.
+    flush_interval
+        the most seconds between a change to a job and it being written out.
+    batch_size
+        the number of changed jobs which trigger a write before flush_interval.
+    """
+    def __init__(self, path: str, flush_interval: float = 1.0, batch_size: int = 1000):
+        self.path           = path
+        self.flush_interval = flush_interval
+        self.batch_size     = batch_size
+
+        self._cond    = threading.Condition()
+        self._states  = {}  # key => state of every job in the journal
+        self._dirty   = {}  # key => row, changes yet to be written
+        self._closed  = False
+        self._writing = False
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, args TEXT, priority INTEGER,'
+                         ' state TEXT, bytes INTEGER, error TEXT, updated REAL)')
+        self._states.update(self._db.execute('SELECT key, state FROM jobs'))
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def encode(download_class, args, kwargs) -> typing.Optional[typing.Tuple[str, str]]:
+        """get the key and serialised arguments of a job, or None when its
+        arguments can't be serialised. jobs with the same arguments share a key."""
+        try:
+            payload = json.dumps({'class': '%s:%s' % (download_class.__module__, download_class.__qualname__),
+                                  'args': list(args), 'kwargs': kwargs}, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest(), payload
+
+    @staticmethod
+    def decode(payload: str):
+        """get the download class, args and kwargs of the serialised arguments of a job"""
+        job = json.loads(payload)
+        module, name = job['class'].split(':', 1)
+
+        download_class = importlib.import_module(module)
+        for attribute in name.split('.'):
+            download_class = getattr(download_class, attribute)
+        return download_class, job['args'], job['kwargs']
+
+    def state(self, key: str) -> typing.Optional[str]:
+        """the state of the job with key, None when it isn't in the journal"""
+        with self._cond:
+            return self._states.get(key)
+
+    def record(self, key: str, payload: str, priority: int = 0):
+        """add the job with key to the journal as pending"""
+        self._change(key, {'args': payload, 'priority': priority, 'state': PENDING, 'bytes': 0, 'error': None})
+
+    def update(self, key: str, state: str, bytes: typing.Optional[int] = None, error: typing.Optional[str] = None):
+        """change the state of the job with key, recording the bytes it has received and its error"""
+        self._change(key, {'state': state, 'bytes': bytes, 'error': error})
+
+    def unfinished(self) -> typing.List[typing.Tuple[str, str, int]]:
+        """the key, serialised arguments and priority of every pending or active job"""
+        with self._cond:
+            self._flush()
+            rows = self._db.execute('SELECT key, args, priority FROM jobs WHERE state IN (?, ?)'
+                                    ' ORDER BY rowid', UNFINISHED).fetchall()
+        return rows
+
+    def counts(self) -> typing.Dict[str, int]:
+        """the number of jobs in each state"""
+        with self._cond:
+            counts = dict.fromkeys((PENDING, ACTIVE, DONE, FAILED, CANCELLED), 0)
+            for state in self._states.values():
+                counts[state] = counts.get(state, 0) + 1
+            return counts
+
+    def flush(self):
+        """write every change made so far to the database"""
+        with self._cond:
+            self._flush()
+
+    def close(self):
+        """write out every change and close the database"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+
+        self.flush()
+        self._db.close()
+
+    def _change(self, key, row):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('journal %s has been closed' % self.path)
+
+            self._states[key] = row['state']
+            previous = self._dirty.get(key)
+            if previous is not None:  # only the latest change needs writing
+                row = dict(previous, **{X: Y for X, Y in row.items() if Y is not None or X == 'error'})
+            self._dirty[key] = dict(row, updated=time.time())
+
+            if len(self._dirty) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _flush(self):
+        self._cond.wait_for(lambda: not self._writing)  # the writer thread is using the database
+        rows, self._dirty = self._dirty, {}
+        if rows:
+            self._write(rows)
+
+    def _write_loop(self):
+        """body of the writer thread, writes batches of changes until closed"""
+        with self._cond:
+            while not self._closed:
+                self._cond.wait_for(lambda: self._closed or len(self._dirty) >= self.batch_size,
+                                    self.flush_interval)
+                if not self._dirty or self._closed:
+                    continue
+
+                rows, self._dirty, self._writing = self._dirty, {}, True
+                self._cond.release()  # don't block changes while writing
+                try:
+                    self._write(rows)
+                finally:
+                    self._cond.acquire()
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, rows):
+        # NOTE a single transaction for the whole batch, so writing a batch costs
+        #      about as much as writing a single change.
+        self._db.execute('BEGIN')
+        try:
+            self._db.executemany(
+                'INSERT INTO jobs (key, args, priority, state, bytes, error, updated)'
+                ' VALUES (:key, :args, :priority, :state, :bytes, :error, :updated)'
+                ' ON CONFLICT (key) DO UPDATE SET args = coalesce(excluded.args, args),'
+                ' priority = coalesce(excluded.priority, priority), state = excluded.state,'
+                ' bytes = coalesce(excluded.bytes, bytes), error = excluded.error, updated = excluded.updated',
+                [dict({'args': None, 'priority': None}, key=key, **row) for key, row in rows.items()])
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
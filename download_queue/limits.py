@@ -0,0 +1,257 @@
+import threading, time, typing
+
+
+class TokenBucket(object):
+    """thread safe token bucket. tokens refill continuously at `rate` per
+    second, upto `capacity` tokens, and are spent by consume/try_consume.
+
+    both rate and capacity can be changed at any time, including while
+    other threads are waiting on the bucket.
+
+    Parameters
+    ----------
+    rate
+        tokens added to the bucket every second.
+    capacity
+        the most tokens the bucket can hold, ie. the largest burst allowed.
+        defaults to rate (but at least 1), a one second burst.
+    """
+    def __init__(self, rate: float, capacity: typing.Optional[float] = None):
+        self._lock     = threading.Lock()
+        self._rate     = float(rate)
+        self._capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens   = self._capacity
+        self._filled   = 0.0  # tokens ever added by refilling, see throttle
+        self._updated  = time.monotonic()
+
+    @property
+    def rate(self): return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate = float(rate)
+
+    @property
+    def capacity(self): return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._capacity = float(capacity)
+            self._tokens   = min(self._tokens, self._capacity)
+
+    def full(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens >= self._capacity
+
+    def delay(self, amount: float = 1) -> float:
+        """seconds until amount tokens will be available, without consuming them"""
+        with self._lock:
+            return self._delay(amount, time.monotonic())
+
+    def try_consume(self, amount: float = 1) -> float:
+        """consume amount tokens if they're available now. returns 0 when they
+        were consumed, otherwise the seconds until they'll be available."""
+        with self._lock:
+            wait = self._delay(amount, time.monotonic())
+            if wait == 0:
+                self._tokens -= amount
+            return wait
+
+    def consume(self, amount: float = 1):
+        """consume amount tokens, blocking the calling thread until they're available.
+        amounts larger than the capacity of the bucket are consumed in parts."""
+        while amount > 0:
+            part = min(amount, self._capacity)
+            wait = self.try_consume(part)
+            if wait:
+                time.sleep(wait)
+            else:
+                amount -= part
+
+    def throttle(self, amount: float):
+        """consume amount tokens, even when that leaves the bucket in debt, and
+        block the calling thread until the debt up to and including them has been
+        refilled. threads are let through in the order they called, so they share
+        the rate fairly, and a change of rate applies to threads already waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            due = self._filled + max(-self._tokens, 0)
+
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                remaining, rate = due - self._filled, self._rate
+            if remaining <= 0:
+                return
+            # NOTE sleep in short slices, so a new rate takes effect straight away
+            time.sleep(min(remaining / rate, 0.1) if rate > 0 else 0.1)
+
+    def _delay(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self._capacity)
+        if self._tokens >= amount:
+            return 0
+        if self._rate <= 0:
+            return float('inf')
+        return (amount - self._tokens) / self._rate
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0 and self._tokens < self._capacity:
+            added = min(self._capacity - self._tokens, elapsed * self._rate)
+            self._tokens += added
+            self._filled += added
+        self._updated = now
+
+
+BANDWIDTH_BURST = 0.1  # seconds of bandwidth which can be used at once
+
+
+class _BandwidthBucket(TokenBucket):
+    """token bucket created by bandwidth_bucket, rather than given to it"""
+
+
+def bandwidth_bucket(bucket: typing.Optional[TokenBucket],
+                     rate: typing.Union[None, float, TokenBucket]) -> typing.Optional[TokenBucket]:
+    """get the token bucket enforcing a bandwidth limit of rate bytes per second,
+    where bucket enforces the current limit. the bucket is reused when it can be,
+    so downloads already waiting on it see the new rate straight away. rate can
+    also be a TokenBucket of its own, to share one limit between several downloads."""
+    if isinstance(rate, TokenBucket):
+        return rate
+    if not isinstance(bucket, _BandwidthBucket):
+        bucket = None  # never change a bucket which was given to us
+
+    if rate is None:
+        if bucket is not None:
+            bucket.rate = float('inf')  # let through anything waiting on it
+        return None
+    if rate <= 0:
+        raise ValueError('bandwidth must be positive, not %r' % rate)
+    # NOTE the burst is kept short, so a download starting on a full bucket
+    #      doesn't get ahead of the downloads already running.
+    if bucket is None:
+        return _BandwidthBucket(rate, rate * BANDWIDTH_BURST)
+
+    bucket.rate, bucket.capacity = rate, rate * BANDWIDTH_BURST
+    return bucket
+
+
+class HostLimit(object):
+    """limits applied to the downloads from a single host, see `download_queue.DownloadQueue`.
+
+    Parameters
+    ----------
+    max_connections
+        the most downloads from the host allowed to run at once. None for no limit.
+    requests_per_second
+        the most downloads from the host allowed to start every second. None for
+        no limit.
+    burst
+        how many downloads can be started at once before requests_per_second
+        applies. defaults to a one second burst.
+    """
+    def __init__(self, max_connections: typing.Optional[int] = None,
+                 requests_per_second: typing.Optional[float] = None,
+                 burst: typing.Optional[float] = None):
+        self.max_connections     = max_connections
+        self.requests_per_second = requests_per_second
+        self.burst               = burst
+
+    def __repr__(self):
+        return '%s(max_connections=%r, requests_per_second=%r, burst=%r)' % (
+            self.__class__.__name__, self.max_connections, self.requests_per_second, self.burst)
+
+    def make_bucket(self):
+        if self.requests_per_second is None:
+            return None
+        return TokenBucket(self.requests_per_second, self.burst)
+
+
+class AdaptiveConcurrency(object):
+    """additive increase, multiplicative decrease (AIMD) control of the length
+    of a download queue, see the adaptive argument of `download_queue.DownloadQueue`.
+
+    Every interval seconds the queue passes its length and stats to update. While
+    downloads are waiting for a slot and the bytes received per second keep rising,
+    the length grows by increase. When downloads are retried (because of errors or
+    timeouts) or the time to the first byte of responses climbs past latency_factor
+    times the lowest seen recently, the length is multiplied by decrease. Otherwise
+    it's left alone. The length is always kept between min_length and max_length.
+
+    Parameters
+    ----------
+    min_length
+        the fewest downloads the queue runs at once.
+    max_length
+        the most downloads the queue runs at once.
+    interval
+        the seconds between updates.
+    increase
+        the slots added while throughput is rising.
+    decrease
+        the fraction of slots kept on errors or rising latency.
+    tolerance
+        how much (as a fraction) throughput must rise between updates to count as rising.
+    latency_factor
+        how many times the baseline latency counts as congestion.
+    """
+    def __init__(self, min_length: int = 1, max_length: int = 64, interval: float = 1.0,
+                 increase: int = 1, decrease: float = 0.5, tolerance: float = 0.05,
+                 latency_factor: float = 2.0):
+        if not 1 <= min_length <= max_length:
+            raise ValueError('expected 1 <= min_length <= max_length, not %r and %r' % (min_length, max_length))
+
+        self.min_length     = min_length
+        self.max_length     = max_length
+        self.interval       = interval
+        self.increase       = increase
+        self.decrease       = decrease
+        self.tolerance      = tolerance
+        self.latency_factor = latency_factor
+
+        self._previous   = None  # stats passed to the last update
+        self._throughput = None  # bytes per second between the last two updates
+        self._baseline   = None  # recent lowest mean time to first byte
+
+    def __repr__(self):
+        return '%s(min_length=%r, max_length=%r, interval=%r)' % (
+            self.__class__.__name__, self.min_length, self.max_length, self.interval)
+
+    def clamp(self, length: int) -> int:
+        return min(max(length, self.min_length), self.max_length)
+
+    def update(self, length: int, stats: dict) -> int:
+        """get the length the queue should have until the next update, given its
+        current length and stats, see `download_queue.DownloadQueue.stats`."""
+        previous, self._previous = self._previous, stats
+        elapsed = stats['uptime'] - previous['uptime'] if previous is not None else 0
+        if elapsed <= 0:
+            return self.clamp(length)
+
+        throughput = (stats['received'] - previous['received']) / elapsed
+        retries    = stats['retries'] - previous['retries']
+        responses  = stats['time_to_first_byte']['count'] - previous['time_to_first_byte']['count']
+        latency    = None
+        if responses:
+            latency = (stats['time_to_first_byte']['sum'] - previous['time_to_first_byte']['sum']) / responses
+            # NOTE the baseline drifts up towards the latency seen, so an origin which
+            #      has become slower for good doesn't keep the queue at its smallest.
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                self._baseline += (latency - self._baseline) * 0.1
+
+        rising, self._throughput = self._throughput is None or throughput > self._throughput * (1 + self.tolerance), throughput
+
+        if retries or (latency is not None and latency > self._baseline * self.latency_factor):
+            return self.clamp(int(length * self.decrease))
+        if rising and stats['pending'] and throughput > 0:  # only grow while downloads are waiting
+            return self.clamp(length + self.increase)
+        return self.clamp(length)
@@ -0,0 +1,104 @@
+import bz2, lzma, os, shutil, typing, zlib
+from abc import ABCMeta, abstractmethod
+
+TransformType = typing.Union[str, typing.Callable[[], 'Transform']]
+
+
+class Transform(metaclass=ABCMeta):
+    """stage run on the chunks of a response as they arrive, before they're
+    written to the destination, see the transforms argument of
+    `download_queue.GenericDownloader`. a new transform is made for every
+    attempt at a download, so it only ever sees a single response.
+    """
+    @abstractmethod
+    def feed(self, data) -> bytes:
+        """transform the next chunk of the response"""
+        pass
+
+    def flush(self) -> bytes:
+        """anything left over once the whole response has been fed"""
+        return b''
+
+
+class Decompress(Transform):
+    """transform which decompresses a gzip, zlib (deflate), bz2 or xz (lzma) response.
+
+    Parameters
+    ----------
+    format
+        one of 'gzip', 'deflate', 'bz2' or 'xz'. gzip also accepts zlib streams.
+    """
+    def __init__(self, format: str = 'gzip'):
+        if format == 'gzip':
+            self._decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)  # detects gzip or zlib headers
+        elif format == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        elif format == 'bz2':
+            self._decompressor = bz2.BZ2Decompressor()
+        elif format in ('xz', 'lzma'):
+            self._decompressor = lzma.LZMADecompressor()
+        else:
+            raise ValueError('unknown compression format: %r' % format)
+        self.format = format
+
+    def feed(self, data) -> bytes:
+        if not data:
+            return b''
+        if self._decompressor.eof:
+            raise ValueError('data after the end of the %s stream' % self.format)
+        return self._decompressor.decompress(data)
+
+    def flush(self) -> bytes:
+        if not self._decompressor.eof:
+            raise ValueError('%s stream ended early' % self.format)
+        return self._decompressor.flush() if hasattr(self._decompressor, 'flush') else b''
+
+
+TRANSFORMS = {X: (lambda format=X: Decompress(format)) for X in ('gzip', 'deflate', 'bz2', 'xz')}
+
+
+def make_transforms(transforms: typing.Iterable[TransformType]) -> typing.List[Transform]:
+    """make a new transform for each of transforms, the name of one in TRANSFORMS
+    or a callable returning a :obj:`Transform`."""
+    made = []
+    for transform in transforms:
+        if isinstance(transform, str):
+            if transform not in TRANSFORMS:
+                raise ValueError('unknown transform: %r' % transform)
+            transform = TRANSFORMS[transform]
+        made.append(transform())
+    return made
+
+
+def transform_chunks(chunks: typing.Iterable[bytes], transforms: typing.List[Transform]) -> typing.Iterator[bytes]:
+    """pass every chunk through each of transforms in turn, yielding what comes out"""
+    for chunk in chunks:
+        for transform in transforms:
+            chunk = transform.feed(chunk)
+        if chunk:
+            yield chunk
+
+    for index, transform in enumerate(transforms):  # flush each one through the rest
+        chunk = transform.flush()
+        for rest in transforms[index+1:]:
+            chunk = rest.feed(chunk)
+        if chunk:
+            yield chunk
+
+
+def extract_archive(path: str, directory: typing.Optional[str] = None) -> typing.List[str]:
+    """unpack the zip or tar archive at path into directory, which defaults to
+    path without its extension, returning the paths of the files unpacked.
+    a post processor for `download_queue.DownloadQueue`, eg.
+
+        DownloadQueue(processor=functools.partial(extract_archive, directory='data'))
+    """
+    if directory is None:
+        directory = os.path.splitext(path)[0]
+        if directory.endswith('.tar'): directory = directory[:-4]
+
+    formats = {'.zip': 'zip', '.tar': 'tar', '.tgz': 'gztar', '.gz': 'gztar', '.bz2': 'bztar', '.xz': 'xztar'}
+    format  = formats.get(os.path.splitext(path)[1].lower())
+
+    shutil.unpack_archive(path, directory, format)
+    return sorted(os.path.join(root, X) for root, dirs, files in os.walk(directory) for X in files)
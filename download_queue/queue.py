@@ -1,18 +1,91 @@
-import warnings, logging, typing
-from threading import BoundedSemaphore, RLock
+import warnings, logging, typing, functools, time, collections, weakref, multiprocessing
+from concurrent.futures import CancelledError, Executor, ProcessPoolExecutor, TimeoutError, as_completed
+from threading import Thread, Condition, Event, Lock, Semaphore, current_thread
 
+from .buffers import MemoryBudget
+from .cache import ResponseCache
 from .downloader import GenericDownloader
+from .futures import DownloadFuture
+from .journal import Journal, ACTIVE, CANCELLED, DONE, FAILED, UNFINISHED
+from .limits import AdaptiveConcurrency, HostLimit, bandwidth_bucket
+from .scheduler import Scheduler
+from .sessions import SessionPool
+from .stats import QueueStats
 
 LoggerOrTruthyType = typing.Union[None, bool, logging.Logger]
 
+def _resolve_logger(logger: LoggerOrTruthyType) -> logging.Logger:
+    """get the logger a queue should use for its logger argument, see `DownloadQueue`"""
+    if logger and isinstance(logger, logging.Logger):
+        return logger
+
+    module_logger = logging.getLogger(__name__)
+    if not logger: module_logger.addHandler(logging.NullHandler())
+    return module_logger
+
+def _worker(scheduler: Scheduler, logger: logging.Logger):
+    """body of a pooled worker thread. repeatedly takes a job from the
+    scheduler and runs it, exiting once the scheduler has been closed.
+
+    NOTE the worker only holds references to the scheduler and the logger, not
+         the owning DownloadQueue, so the queue can still be garbage collected
+         while its workers are idle.
+    """
+    while True:
+        job = scheduler.get()
+        if job is None: break  # scheduler closed
+
+        try:
+            job.run()
+        except Exception:  # keep the worker alive for the next job
+            logger.exception('uncaught error in download worker')
+        finally:
+            scheduler.release(job)
+            job = None  # release the job (and its downloader) while idle
+
+def _processing_target(downloader):
+    """what a post processor is given for downloader, the path of its destination
+    when it has one (including a file it opened itself), otherwise its destination"""
+    destination = getattr(downloader, 'destination', None)
+    name        = getattr(destination, 'name', None)
+    return name if isinstance(name, str) else destination
+
+def _adapter(queue: 'weakref.ref[DownloadQueue]', stopped: Event, interval: float):
+    """body of the thread resizing an adaptive queue every interval seconds,
+    until stopped is set or the queue has been garbage collected."""
+    while not stopped.wait(interval):
+        owner = queue()
+        if owner is None: break
+
+        try:
+            owner._adapt()
+        except Exception:
+            owner.logger.exception('failed to adapt the length of the download queue')
+        owner = None  # don't keep the queue alive while waiting
+
+
 class DownloadQueue(object):
     """queue like data structure allowing concurrent downloading.
 
     This class provides the main interface to the DownloadQueue API. Whenever
     you wish to download something concurrently, simply pass your arguments to
     queue.add or queue.enqueue and the appropriate downloader will be instantiated
-    and subsequently started. If the queue is full, the calling thread will be
-    blocked until its request can be satisfied.
+    and handed to one of the queues worker threads. If the queue is full, the
+    calling thread will be blocked until its request can be satisfied.
+
+    The queue owns a pool of `length` long lived worker threads which are started
+    on construction and reused for every download, so adding a download never
+    creates a new thread. Call queue.close() to stop them once you're done.
+
+    Downloads of the same response (the same url, params, headers and cookies)
+    added while one of them is still running are merged. only the first is
+    actually downloaded, and once it finishes its body is copied to the
+    destination of every other. when it fails, they fail with the same error.
+
+    Downloads can also be limited per host, both in how many may run at once and
+    in how many may start every second. A download whose host is at its limit
+    waits without taking up one of the `length` slots of the queue, so downloads
+    from other hosts can run in the meantime.
 
     This class also supports the context manager protocol, with the guarantee that
     on exit from the manager, all existing downloads will be completed.
@@ -24,44 +97,165 @@ class DownloadQueue(object):
     ----------
     length
         the amount of concurrent downloads the queue is allowed to fascilitate.
+        when the queue is adaptive, the amount it starts with. can be changed
+        later with `DownloadQueue.resize`.
+    backlog
+        the amount of downloads allowed to wait for a free slot in the queue,
+        add blocks while this many are waiting. defaults to length.
     logger
         the logger to be used by this object. if it's a logging.Logger instance
         this thread will use it as it's sole logger. If otherwise it's a truthy
         value logging.getLogger(__name__) will be used and if its a falsy value
         the same logger will be used, however a null handler will be added.
+    sessions
+        the pool of keep-alive http sessions shared by every downloader added
+        to the queue. when not given, a pool keeping up to `length` connections
+        open to each host is created. it's closed alongside the queue.
+    host_limit
+        the :obj:`download_queue.HostLimit` applied to every host which doesn't
+        have its own entry in host_limits. by default hosts aren't limited.
+    host_limits
+        a mapping of host names (eg. 'example.com') to the HostLimit applied to
+        downloads from that host.
+    metrics
+        the :obj:`download_queue.QueueStats` the queue records throughput and
+        latency statistics to, see `DownloadQueue.stats`. when not given, one
+        which times every chunk and has no metrics sink is created.
+    cache
+        the :obj:`download_queue.ResponseCache` downloaders use to skip
+        downloading responses which haven't changed since the last time
+        they were downloaded. by default nothing is cached.
+    deduplicate
+        when falsy, downloads of the same response are never merged.
+    bandwidth
+        the most bytes per second all the downloads in the queue may receive
+        between them, shared fairly between the running downloads. None for
+        no limit. see `DownloadQueue.bandwidth`.
+    memory_budget
+        the most bytes (or a :obj:`download_queue.MemoryBudget`) the buffers
+        of downloads which aren't streamed may hold in memory between them.
+        a download whose buffer would exceed it is buffered in a temporary file
+        instead. buffers are freed as soon as their download has been written
+        out. by default memory isn't limited, but it's still accounted for, see
+        `DownloadQueue.stats`.
+    processor
+        a callable every successful download is post processed with, on the
+        process pool of the queue, such as `download_queue.pipeline.extract_archive`.
+        it's called with the path of the destination (or the destination, when it
+        isn't a path) and what it returns is found in the processed attribute of
+        the future of the download, which is only done once it's been processed.
+        when it raises, the future fails with its error. see also the process
+        argument of `DownloadQueue.add`.
+
+        NOTE with a process pool the processor, and what it returns, must be
+             picklable, so it has to be a module level function (or a partial)
+             of a module the processes of the pool can import.
+    process_pool
+        the `concurrent.futures.Executor` downloads are post processed on, or the
+        number of processes of the `ProcessPoolExecutor` created for them. by
+        default one with a process per cpu is created when it's first needed.
+        a pool created by the queue is shut down alongside it, and starts its
+        processes with the forkserver (or spawn) start method, never by forking.
+    process_backlog
+        the most downloads waiting for, or being, post processed. a download
+        which finishes while it's reached keeps its slot in the queue until the
+        processor has caught up, so downloading never gets too far ahead of
+        processing. defaults to length.
+    adaptive
+        the :obj:`download_queue.AdaptiveConcurrency` which tunes the length of
+        the queue while it runs, growing it while throughput rises and shrinking
+        it on errors or rising latency. by default the length is fixed.
+    journal
+        the path of a sqlite database (or a :obj:`download_queue.Journal`) in
+        which every download added to the queue, and its state, is recorded.
+        When a queue is created with a journal left behind by a queue that
+        didn't finish (because the process crashed, for example), the downloads
+        which were pending or active are added to it straight away. Adding a
+        download which the journal says has already finished returns a finished
+        future for it, without downloading it again.
+
+        NOTE a download streamed to a path picks up from the partial file it left
+             behind, any other download starts again from the beginning.
     """
-    def __init__(self, length: int = 5, logger: LoggerOrTruthyType = None):
-        self.max_length, self.length = length, 0
+    def __init__(self, length: int = 5, logger: LoggerOrTruthyType = None,
+                 sessions: typing.Optional[SessionPool] = None,
+                 host_limit: typing.Optional[HostLimit] = None,
+                 host_limits: typing.Optional[typing.Dict[str, HostLimit]] = None,
+                 backlog: typing.Optional[int] = None,
+                 metrics: typing.Optional[QueueStats] = None,
+                 cache: typing.Optional[ResponseCache] = None,
+                 deduplicate: bool = True,
+                 journal: typing.Union[None, str, Journal] = None,
+                 bandwidth: typing.Optional[float] = None,
+                 memory_budget: typing.Union[None, int, MemoryBudget] = None,
+                 processor: typing.Optional[typing.Callable] = None,
+                 process_pool: typing.Union[None, int, Executor] = None,
+                 process_backlog: typing.Optional[int] = None,
+                 adaptive: typing.Optional[AdaptiveConcurrency] = None):
+        length = adaptive.clamp(length) if adaptive is not None else length
 
-        self._downloads_s = BoundedSemaphore(length)  # number of active downloads
-        self._available_s = BoundedSemaphore(length)  # available slots in the queue
+        self.max_length  = length
+        self.adaptive    = adaptive
+        self.sessions    = sessions if sessions is not None else SessionPool(
+            pool_size=adaptive.max_length if adaptive is not None else length)
+        self.metrics     = metrics if metrics is not None else QueueStats()
+        self.cache       = cache
+        self.deduplicate = deduplicate
+        self.journal     = Journal(journal) if isinstance(journal, str) else journal
+        self.memory      = memory_budget if isinstance(memory_budget, MemoryBudget) else MemoryBudget(memory_budget)
+        self.processor   = processor
+        self.logger      = _resolve_logger(logger)
+        self._bandwidth  = None
+        self.bandwidth   = bandwidth
 
-        for X in range(length): self._downloads_s.acquire(False)  # deplete bounded
+        self._scheduler = Scheduler(length, backlog if backlog is not None else length, host_limit, host_limits)
+        self._completion = Condition()  # notified whenever a download finishes
+        self._unfinished = 0            # downloads whose future isn't done yet
+        self._completed  = collections.deque()  # futures of finished downloads as_completed hasn't yielded
+        self._inflight   = {}           # dedupe key => [downloader, *downloaders merged into it]
+        self._journaled  = {}           # journal key => future of every unfinished journaled download
+        self._inflight_lock = Lock()    # guards both of the above
+        self._own_journal   = self.journal if isinstance(journal, str) else None
+        self._own_sessions  = sessions is None
+        self._pool          = process_pool if isinstance(process_pool, Executor) else None
+        self._pool_size     = process_pool if isinstance(process_pool, int) else None
+        self._own_pool      = not isinstance(process_pool, Executor)
+        self._pool_lock     = Lock()
+        self._processing    = Semaphore(process_backlog if process_backlog is not None else length)
+        self._workers       = []
+        self._workers_lock  = Lock()    # guards the workers when resizing
+        self._spawn_workers(length)
 
-        self._queue_lock = RLock()  # sync length modification operations
+        self._stopped = Event()  # set once the workers have been stopped
+        if adaptive is not None:
+            Thread(target=_adapter, args=(weakref.ref(self), self._stopped, adaptive.interval), daemon=True).start()
 
-        if logger and isinstance(logger, logging.Logger):
-            self.logger = logger
-        else:
-            self.logger = logging.getLogger(__name__)  # module logger
-            if not logger: self.logger.addHandler(logging.NullHandler())
+        if self.journal is not None:
+            self._resume_journal()
 
     def __del__(self,):
-        with self._queue_lock:
-            if self.length > 0:
-                msg = "attempted to delete download queue at %s before all downloads finished" % (hex(id(self)))
-                warnings.warn(msg, category=RuntimeWarning)  # give runtime warning on exit before download completion
-                self.wait_until_finished()  # force exit to wait until download queue is complete and then finish
+        if self.length > 0:
+            msg = "attempted to delete download queue at %s before all downloads finished" % (hex(id(self)))
+            warnings.warn(msg, category=RuntimeWarning)  # give runtime warning on exit before download completion
+            self.wait_until_finished()  # force exit to wait until download queue is complete and then finish
+
+        self._stop_workers()
+        self._close_journal()
 
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, traceback):
         self.wait_until_finished()
+        self._forget_completed()
+        if self.journal is not None:
+            self.journal.flush()
 
     def add(self, *args, **kwargs):
-        """begin a new download using the given args and kwargs.
-        blocks when to many downloads are already taking place.
+        """begin a new download using the given args and kwargs. the download
+        waits in the backlog of the queue until a slot is free, add blocks when
+        the backlog is full. returns a :obj:`download_queue.DownloadFuture` for
+        the download.
 
         See also: `download_queue.Downloader`
 
@@ -70,50 +264,424 @@ class DownloadQueue(object):
         download_class
             the download_queue.Downloader like class which you is to be
             initialised and then begun
+        priority
+            downloads with a larger priority leave the backlog first. defaults to 0.
+        block
+            when falsy, raise `queue.Full` instead of blocking on a full backlog.
+        timeout
+            the most seconds to block for before raising `queue.Full`.
+        process
+            the post processor for this download, instead of the processor of
+            the queue. see `DownloadQueue`.
         """
-        dclass  = kwargs.pop('download_class', GenericDownloader)
+        dclass   = kwargs.pop('download_class', GenericDownloader)
+        priority = kwargs.pop('priority', 0)
+        block    = kwargs.pop('block', True)
+        timeout  = kwargs.pop('timeout', None)
+        process  = kwargs.pop('process', None)
+
+        job = self.journal.encode(dclass, args, kwargs) if self.journal is not None else None
+        if job is not None:
+            future = self._journaled_future(job[0], dclass, args, kwargs)
+            if future is not None:
+                return future
+
         dloader = dclass(self, *args, completion_hook=self._complete_handler, **kwargs)
-        # NOTE init downloader before acquiring semaphore for it, because it could fail
+        dloader.process = process
+        # NOTE init downloader before waiting for space for it, because it could fail
 
-        self._available_s.acquire()  # -1
-        self._downloads_s.release()  # +1
-        self._increment_length()
+        if self._scheduler.closed:
+            raise RuntimeError('download queue %s has been closed' % hex(id(self)))
 
-        dloader.begin()
+        return self._enqueue(dloader, priority, job, functools.partial(self._scheduler.put, block=block, timeout=timeout))
 
     enqueue = add
 
+    def add_many(self, downloads: typing.Iterable, **kwargs):
+        """add every download in the iterable downloads, consuming it lazily so
+        only the backlog of the queue is ever held in memory. blocks whenever
+        the backlog is full, which applies backpressure to a generator.
+
+        each download is either a tuple of positional arguments for add or a
+        dict of keyword arguments for it. kwargs are passed to every call to
+        add, underneath the arguments of each download.
+
+            queue.add_many(line.split() for line in open('manifest.txt'))
+
+        returns the number of downloads added.
+        """
+        count = 0
+        for download in downloads:
+            if isinstance(download, dict):
+                self.add(**dict(kwargs, **download))
+            else:
+                self.add(*download, **kwargs)
+            count += 1
+        return count
+
+    def _enqueue(self, downloader, priority, job, put):
+        """give downloader a future and pass a job running it to put, one of
+        the put methods of the scheduler. job is the journal key and serialised
+        arguments of the download, when it's journaled."""
+        # NOTE worked out before anything is recorded, because it could fail (on a malformed link)
+        downloader.merge_key = downloader.dedupe_key if self.deduplicate else None
+        downloader.future    = DownloadFuture(downloader)
+        downloader.queued_at = time.monotonic()
+        downloader.priority  = priority
+        with self._completion:
+            self._unfinished += 1
+
+        if job is not None:
+            downloader.journal_key = job[0]
+            with self._inflight_lock:
+                self._journaled[job[0]] = downloader.future
+            self.journal.record(job[0], job[1], priority)
+
+        if self._merge(downloader):
+            return downloader.future
+
+        try:
+            put(functools.partial(self._run, downloader), getattr(downloader, 'host', None), priority)
+        except BaseException:
+            self._unmerge(downloader)
+            self._journal(downloader, CANCELLED)
+            self._settle(None)
+            raise
+
+        return downloader.future
+
+    def _run(self, downloader):
+        """job run by a worker thread for every download added to the queue"""
+        future = downloader.future
+        if future.running() or future.set_running_or_notify_cancel():  # running when retried
+            self._journal(downloader, ACTIVE)
+            downloader.download()
+        else:
+            self._settle(future)  # cancelled while waiting in the backlog
+            self._unmerge(downloader)
+            self._journal(downloader, CANCELLED)
+
+    def _journaled_future(self, key, dclass, args, kwargs):
+        """the future of the journaled download with key, when it's already been
+        added to the queue or the journal says it's already finished"""
+        with self._inflight_lock:
+            future = self._journaled.get(key)
+
+        if future is None and self.journal.state(key) == DONE:
+            dloader = dclass(self, *args, **kwargs)
+            dloader.complete = True
+            future = DownloadFuture(dloader)
+            future.set_running_or_notify_cancel()
+            future.set_result(dloader)
+        return future
+
+    def _journal(self, downloader, state):
+        """record the new state of downloader in the journal, when it's journaled"""
+        key = getattr(downloader, 'journal_key', None)
+        if key is None:
+            return
+
+        if state not in UNFINISHED:
+            with self._inflight_lock:
+                self._journaled.pop(key, None)
+
+        error = repr(downloader.error) if downloader.error is not None else None
+        self.journal.update(key, state, downloader.bytes_received, error)
+
+    def _resume_journal(self):
+        """add every download the journal says is unfinished to the queue"""
+        for key, payload, priority in self.journal.unfinished():
+            try:
+                dclass, args, kwargs = Journal.decode(payload)
+                dloader = dclass(self, *args, completion_hook=self._complete_handler, **kwargs)
+            except Exception as e:
+                self.logger.exception('failed to resume journaled download: %s' % payload)
+                self.journal.update(key, FAILED, error=repr(e))
+                continue
+
+            # NOTE resumed downloads skip the backlog, so creating the queue never blocks.
+            self._enqueue(dloader, priority, (key, payload), functools.partial(self._scheduler.put_later, delay=0))
+
+    def _close_journal(self):
+        journal, self._own_journal = self._own_journal, None
+        if journal is not None:
+            journal.close()
+
+    def _merge(self, downloader):
+        """merge downloader into a running download of the same response,
+        returning whether it was. otherwise it's recorded as running."""
+        key = downloader.merge_key
+        if key is None:
+            return False
+
+        with self._inflight_lock:
+            merged = self._inflight.setdefault(key, [])
+            merged.append(downloader)
+            return len(merged) > 1
+
+    def _unmerge(self, downloader):
+        """forget downloader once it's finished, returning the downloads which
+        were merged into it. when downloader never ran (it was cancelled), the
+        first of those is run instead, with the rest merged into it."""
+        key = getattr(downloader, 'merge_key', None)
+        with self._inflight_lock:
+            merged = self._inflight.get(key)
+            if not merged or merged[0] is not downloader:
+                return []
+
+            del self._inflight[key]
+            if downloader.started_at is not None or len(merged) == 1:
+                return merged[1:]
+
+            self._inflight[key] = merged[1:]
+        self._reschedule(merged[1], 0)
+        return []
+
+    def _reschedule(self, downloader, delay):
+        """retry downloader after delay seconds, see `download_queue.decorators.RetryLater`.
+        the slot the downloader was running in is given back in the meantime."""
+        self._scheduler.put_later(functools.partial(self._run, downloader), getattr(downloader, 'host', None),
+                                  getattr(downloader, 'priority', 0), delay)
+
     def _complete_handler(self, downloader):
-        """invoke after a download thread is complete"""
-        self._decrement_length()
-        self._downloads_s.acquire(blocking=False)  # -1
-        # don't block, because semaphore is only for use
-        # in `DownloadQueue.wait_until_finished'.
-        self._available_s.release()                # +1
+        """invoke after a download is complete"""
+        # NOTE the slot held by the download is given back by the worker
+        #      thread, once the download (and this hook) has returned.
+        future = downloader.future
+        if future is None:
+            return
+
+        merged    = self._unmerge(downloader)
+        processor = getattr(downloader, 'process', None) or self.processor
+        if not (downloader.complete and processor):
+            self._finish(downloader)
+
+        for X in merged:  # copy the body received to the other destinations
+            X._source = downloader
+            self._run(X)
+
+        if downloader.complete and processor:  # NOTE once the merged downloads have copied it
+            self._process(downloader, processor)
+
+    def _finish(self, downloader, error=None):
+        """settle the future of downloader, failing it with error when given"""
+        future = downloader.future
+        self._journal(downloader, DONE if downloader.complete and error is None else FAILED)
+
+        if error is not None:
+            future.set_exception(error)
+        elif downloader.complete:
+            future.set_result(downloader)
+        else:
+            future.set_exception(downloader.error or RuntimeError('download failed: %r' % downloader.serialise_args()))
+        # NOTE break the reference cycle between the downloader and its future, which
+        #      would otherwise keep the queue (and its workers) alive until collected.
+        downloader.future = None
+        self._settle(future)
+
+    def _process(self, downloader, processor):
+        """post process downloader on the process pool, finishing it once that's
+        done. blocks while process_backlog downloads are already being processed."""
+        self._processing.acquire()
+        try:
+            pending = self._process_pool().submit(processor, _processing_target(downloader))
+        except Exception as e:
+            self._processing.release()
+            return self._finish(downloader, e)
+
+        pending.add_done_callback(functools.partial(self._processed, downloader))
+
+    def _processed(self, downloader, pending):
+        """done callback of the post processing of downloader"""
+        self._processing.release()
+        try:
+            downloader.processed = pending.result()
+        except (Exception, CancelledError) as e:
+            self.logger.error('failed to process download: %r' % downloader.serialise_args(), exc_info=e)
+            return self._finish(downloader, e)
+        self._finish(downloader)
+
+    def _process_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # NOTE the pool is made by a worker thread while others hold locks, which
+                #      forked processes would inherit held, so they're never forked.
+                method     = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(self._pool_size, mp_context=multiprocessing.get_context(method))
+            return self._pool
+
+    def _settle(self, future):
+        """record that a download has finished, passing its future to as_completed"""
+        with self._completion:
+            self._unfinished -= 1
+            if future is not None:
+                self._completed.append(future)
+            self._completion.notify_all()
+
+    def _reserve_slots(self, count, host=None):
+        """take upto count free slots in the queue for connections to host
+        without blocking, for a running downloader to use for extra connections.
+        returns the number of slots taken, each of which must be used by
+        passing a job to `_submit`."""
+        return self._scheduler.reserve(host, count)
+
+    def _submit(self, job, host=None):
+        """run the callable job on one of the queues worker threads, in a slot
+        taken with `_reserve_slots`. the slot is given back once job returns."""
+        self._scheduler.put_reserved(job, host)
 
     def wait_until_finished(self):
-        """blocks the calling thread until all active downloads finish"""
-        # NOTE acquire all the available slots in the queue, so that
-        # the calling thread must wait until all the downloads are
-        # complete and then release all slots immeadiately afterwards
-        # WARN this assumes you aren't trying to add more downloads
-        # while waiting for the existing downloads to finish.
-        for X in range(self.max_length): self._available_s.acquire()
-        for X in range(self.max_length): self._available_s.release()
+        """blocks the calling thread until all downloads, including any added
+        while waiting, finish"""
+        self._scheduler.join()
+        self.wait()  # and for them to be post processed
 
     wait_to_finish = wait_until_finished
 
-    def _increment_length(self):
-        with self._queue_lock:
-            self.length += 1
+    def wait(self, timeout: typing.Optional[float] = None) -> bool:
+        """blocks the calling thread until every download added to the queue
+        has finished, or upto timeout seconds. returns whether they finished."""
+        with self._completion:
+            return self._completion.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def as_completed(self, futures: typing.Optional[typing.Iterable[DownloadFuture]] = None,
+                     timeout: typing.Optional[float] = None) -> typing.Iterator[DownloadFuture]:
+        """iterate over download futures as they finish, see `concurrent.futures.as_completed`.
+
+        without futures, every download added to the queue is yielded once it's
+        finished (including downloads added while iterating, and downloads which
+        finished before as_completed was called) until none are left unfinished.
+        if timeout seconds pass before then, `concurrent.futures.TimeoutError` is
+        raised. each download is only yielded once, by whichever iteration gets
+        to it first.
+
+        NOTE the queue keeps the future of every finished download until it's
+             been yielded, or the queue is closed (or its with block exits). a
+             queue which runs for a long time without ever being iterated over
+             should be given its futures instead.
+
+            for future in queue.as_completed():
+                if future.exception() is None:
+                    process(future.downloader.destination)
+        """
+        if futures is not None:
+            return as_completed(futures, timeout)
+        return self._iterate_completed(timeout)
+
+    def _iterate_completed(self, timeout):
+        deadline, finished = None if timeout is None else time.monotonic() + timeout, self._completed
+
+        while True:
+            with self._completion:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if not self._completion.wait_for(lambda: finished or self._unfinished == 0, remaining):
+                    raise TimeoutError('%d downloads unfinished' % self._unfinished)
+                if not finished:
+                    return
+                future = finished.popleft()
+            yield future
+
+    def _forget_completed(self):
+        """drop the finished futures as_completed hasn't yielded. they reference
+        their downloaders, which reference the queue, so they'd keep it alive."""
+        with self._completion:
+            self._completed.clear()
+
+    def close(self):
+        """wait for all active downloads to finish and then stop the worker
+        threads. no more downloads can be added to the queue afterwards."""
+        self.wait_until_finished()
+        self._forget_completed()
+        self._stop_workers()
+        self.sessions.close()
+
+        if self._own_pool:
+            pool, self._pool = self._pool, None
+            if pool is not None: pool.shutdown()
+
+        if self.journal is not None:
+            self.journal.flush()
+            self._close_journal()
+
+    def _spawn_workers(self, count):
+        """start more worker threads until there are at least count of them"""
+        while len(self._workers) < count:
+            worker = Thread(target=_worker, args=(self._scheduler, self.logger), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _stop_workers(self):
+        with self._workers_lock:
+            workers, self._workers = self._workers, []
+            self._scheduler.close()
+        self._stopped.set()
+
+        for worker in workers:
+            if worker is not current_thread():  # the queue was collected on one of its workers
+                worker.join()
+
+    def resize(self, length: int):
+        """change the number of downloads the queue runs at once, including while
+        downloads are running. growing the queue starts running waiting downloads
+        straight away. when shrinking it, running downloads are left to finish,
+        and no more are started until fewer than length are running.
 
-    def _decrement_length(self):
-        with self._queue_lock:
-            self.length -= 1
+        NOTE worker threads aren't stopped when the queue shrinks, they wait idle
+             so a queue which grows again (as adaptive queues do) reuses them.
+        """
+        if length < 1:
+            raise ValueError('length of a download queue must be positive, not %r' % length)
+
+        with self._workers_lock:
+            if self._scheduler.closed:
+                raise RuntimeError('download queue %s has been closed' % hex(id(self)))
+
+            self.max_length = length
+            if self._own_sessions and length > self.sessions.pool_size:
+                self.sessions.resize(length)  # keep a connection open for every worker
+            self._spawn_workers(length)
+            self._scheduler.resize(length)
+
+    def _adapt(self):
+        """resize the queue to the length its adaptive controller wants"""
+        length = self.adaptive.update(self.max_length, self.stats())
+        if length != self.max_length and not self._scheduler.closed:
+            self.logger.debug('resizing download queue from %d to %d' % (self.max_length, length))
+            self.resize(length)
+
+    def stats(self) -> dict:
+        """get a snapshot of the statistics of the queue, see `download_queue.QueueStats`,
+        alongside the number of downloads currently running and waiting to run, and
+        the bytes their buffers hold in memory, see `download_queue.MemoryBudget`."""
+        snapshot = self.metrics.snapshot()
+        snapshot.update({
+            'active':   self._scheduler.active,
+            'pending':  self._scheduler.pending,
+            'capacity': self._scheduler.capacity,
+            'buffered': self.memory.used,
+            'spills':   self.memory.spills,
+        })
+        return snapshot
+
+    @property
+    def bandwidth(self) -> typing.Optional[float]:
+        """the most bytes per second the queue may receive, None for no limit.
+        changing it applies straight away, including to running downloads."""
+        return self._bandwidth.rate if self._bandwidth is not None else None
+
+    @bandwidth.setter
+    def bandwidth(self, rate):
+        self._bandwidth = bandwidth_bucket(self._bandwidth, rate)
+
+    @property
+    def length(self):
+        """the number of downloads running or waiting to run"""
+        return len(self._scheduler)
 
     @property
     def ready(self):
-        return self.length < self.max_length
+        """whether add can be called without blocking"""
+        return self._scheduler.pending < self._scheduler.backlog
 
     @property
     def qlength(self): return self.max_length
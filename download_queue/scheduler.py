@@ -0,0 +1,230 @@
+import collections, itertools, heapq, time, typing
+from queue import Full
+from threading import Condition
+
+from .limits import HostLimit
+
+
+class _Job(object):
+    __slots__ = ('run', 'host', 'key')
+
+    def __init__(self, run, host, key):
+        self.run, self.host, self.key = run, host, key  # key orders waiting jobs
+
+    def __lt__(self, other): return self.key < other.key
+
+
+class _HostState(object):
+    __slots__ = ('limit', 'bucket', 'pending', 'active')
+
+    def __init__(self, limit):
+        self.limit   = limit
+        self.bucket  = limit.make_bucket()
+        self.pending = []  # heap of waiting jobs
+        self.active  = 0
+
+    def saturated(self):
+        return self.limit.max_connections is not None and self.active >= self.limit.max_connections
+
+    def idle(self):
+        return not self.pending and not self.active and (self.bucket is None or self.bucket.full())
+
+
+class Scheduler(object):
+    """hands the jobs of a download queue to its worker threads.
+
+    Jobs waiting to run are kept per host, and a worker is given the job with
+    the highest priority (the oldest amongst equals) whose host isn't at its
+    connection limit and has a request token available. A job only takes one of the `capacity` slots of the queue once
+    it's handed to a worker, so jobs for a saturated host never hold slots
+    which jobs for other hosts could be using.
+
+    NOTE this is an internal class of `download_queue.DownloadQueue`.
+
+    Parameters
+    ----------
+    capacity
+        the most jobs allowed to run at once.
+    backlog
+        the most jobs allowed to wait for a slot, put blocks while it's reached.
+    host_limit
+        the limits applied to every host without an entry in host_limits.
+    host_limits
+        a mapping of host names to the limits applied to them.
+    """
+    def __init__(self, capacity: int, backlog: int,
+                 host_limit: typing.Optional[HostLimit] = None,
+                 host_limits: typing.Optional[typing.Dict[str, HostLimit]] = None):
+        self.capacity    = capacity
+        self.backlog     = backlog
+        self.host_limit  = host_limit or HostLimit()
+        self.host_limits = dict(host_limits or {})
+
+        self.active  = 0  # jobs holding a slot
+        self.pending = 0  # jobs waiting for a slot
+        self.delayed = 0  # jobs waiting to be retried, see put_later
+        self.closed  = False
+
+        self._cond    = Condition()
+        self._hosts   = {}                   # host => _HostState
+        self._ready   = collections.deque()  # jobs which already hold a slot
+        self._later   = []                   # heap of (due time, job) added by put_later
+        self._counter = itertools.count()
+
+    def __len__(self): return self.active + self.pending + self.delayed
+
+    def put(self, run, host=None, priority=0, block=True, timeout=None):
+        """add the callable run to the jobs waiting for a slot, jobs with a larger
+        priority run first. blocks while the backlog is full, upto timeout seconds,
+        unless block is falsy. raises `queue.Full` if the job couldn't be added."""
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+
+            while self.pending >= self.backlog and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise Full
+                self._cond.wait(remaining)
+
+            if self.closed:
+                raise RuntimeError('scheduler has been closed')
+
+            heapq.heappush(self._host_state(host).pending, _Job(run, host, (-priority, next(self._counter))))
+            self.pending += 1
+            self._cond.notify_all()
+
+    def put_later(self, run, host=None, priority=0, delay=0):
+        """add the callable run to the jobs waiting for a slot once delay seconds
+        have passed. this never blocks, because it's used by running jobs to
+        retry themselves, so a full backlog is ignored."""
+        with self._cond:
+            job = _Job(run, host, (-priority, next(self._counter)))
+            heapq.heappush(self._later, (time.monotonic() + delay, job.key, job))
+            self.delayed += 1
+            self._cond.notify_all()
+
+    def reserve(self, host=None, count=1):
+        """take upto count slots for jobs to host without blocking, returning how
+        many were taken. each slot is used by passing a job to `put_reserved`."""
+        with self._cond:
+            state, taken = self._host_state(host), 0
+
+            while taken < count and self.active < self.capacity and not state.saturated():
+                if state.bucket is not None and state.bucket.try_consume():
+                    break
+                self._take_slot(state)
+                taken += 1
+
+            self._forget_idle(host, state)
+            return taken
+
+    def put_reserved(self, run, host=None):
+        """run the callable run on the next free worker, using a slot taken with reserve"""
+        with self._cond:
+            self._ready.append(_Job(run, host, None))
+            self._cond.notify_all()
+
+    def get(self) -> typing.Optional[_Job]:
+        """wait for a job that can be run and take a slot for it. returns None
+        once the scheduler has been closed."""
+        with self._cond:
+            while True:
+                if self.closed:
+                    return None
+                if self._ready:
+                    return self._ready.popleft()
+
+                job, timeout = self._pop_runnable()
+                if job is not None:
+                    return job
+
+                self._cond.wait(timeout)
+
+    def release(self, job: _Job):
+        """give back the slot held by job, once it's finished running"""
+        with self._cond:
+            state = self._hosts[job.host]
+            state.active -= 1
+            self.active  -= 1
+            self._forget_idle(job.host, state)
+            self._cond.notify_all()
+
+    def resize(self, capacity: int):
+        """change the most jobs allowed to run at once. when shrinking, running jobs
+        keep their slots and no more are handed out until fewer than capacity run."""
+        with self._cond:
+            self.capacity = capacity
+            self._cond.notify_all()
+
+    def join(self, timeout: typing.Optional[float] = None) -> bool:
+        """wait until there are no running or waiting jobs. returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self) == 0, timeout)
+
+    def close(self):
+        """stop handing out jobs, every call to get returns None from now on"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def _pop_runnable(self):
+        """find the most important job which can run now. when there isn't one,
+        returns the time until one may be able to run because of a rate limit."""
+        timeout = self._promote_due()
+        if self.active >= self.capacity:
+            return None, timeout
+
+        best, idle = None, []
+        for host, state in self._hosts.items():
+            if not state.pending or state.saturated():
+                if state.idle(): idle.append(host)
+                continue
+
+            wait = state.bucket.delay() if state.bucket is not None else 0
+            if wait:
+                timeout = wait if timeout is None else min(timeout, wait)
+            elif best is None or state.pending[0] < best.pending[0]:
+                best = state
+
+        for host in idle: del self._hosts[host]
+
+        if best is None:
+            return None, timeout
+
+        if best.bucket is not None:
+            best.bucket.try_consume()
+
+        job = heapq.heappop(best.pending)
+        self.pending -= 1
+        self._take_slot(best)
+        self._cond.notify_all()  # backlog has space again
+        return job, None
+
+    def _promote_due(self):
+        """move delayed jobs whose time has come into the jobs waiting for a
+        slot. returns the time until the next delayed job is due, if any."""
+        now = time.monotonic()
+        while self._later and self._later[0][0] <= now:
+            job = heapq.heappop(self._later)[2]
+            heapq.heappush(self._host_state(job.host).pending, job)
+            self.delayed -= 1
+            self.pending += 1
+        return self._later[0][0] - now if self._later else None
+
+    def _take_slot(self, state):
+        state.active += 1
+        self.active  += 1
+
+    def _host_state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            limit = self.host_limits.get(host, self.host_limit) if host is not None else HostLimit()
+            state = self._hosts[host] = _HostState(limit)
+        return state
+
+    def _forget_idle(self, host, state):
+        # NOTE hosts are forgotten once idle, so the scheduler doesn't grow with
+        #      every host ever downloaded from. rate limited hosts are kept until
+        #      their bucket refills, so forgetting them doesn't reset the limit.
+        if state.idle():
+            del self._hosts[host]
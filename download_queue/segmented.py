@@ -0,0 +1,211 @@
+import os, threading
+
+from .downloader import GenericDownloader, IntegrityError, FileType, _preallocate, _response_validator, _parse_content_range
+
+
+class SegmentedDownloader(GenericDownloader):
+    def __init__(self, download_queue,
+                 link:             str,
+                 dest:             FileType,
+                 segments:         int = 4,
+                 min_segment_size: int = 2 ** 20,
+                 **kwargs):
+        """Downloader which fetches a single large file over several
+        connections at once. The size of the file is first probed with
+        a HEAD request, and if the server accepts range requests the
+        file is split into byte ranges which are downloaded concurrently
+        and written in place into a preallocated partial file beside
+        the destination. The partial file is renamed to dest once every
+        range has been received.
+
+        The extra connections count against the concurrency budget of the
+        download queue. Only ranges for which a free slot in the queue is
+        available are fetched in parallel, the rest are fetched in turn by
+        the connections already running, so `DownloadQueue(length)` still
+        caps the total number of connections.
+
+        When the file is too small to be split, its size is unknown, the
+        server doesn't accept range requests or dest isn't a path the
+        download falls back to streaming it like `GenericDownloader`.
+
+        Parameters
+        ----------
+        segments
+            the number of byte ranges the file is split into.
+        min_segment_size
+            the smallest size, in bytes, of a single range. files smaller
+            than twice this aren't split.
+        **kwargs
+            see `GenericDownloader`. stream is always enabled.
+
+        NOTE a retry after a failed attempt resumes every range from the
+             last byte it received, but progress isn't kept between runs.
+        """
+        self.segments         = max(segments, 1)
+        self.min_segment_size = max(min_segment_size, 1)
+        self._ranges          = []  # [start, next byte to fetch, end] of every segment
+        self._ranges_lock     = threading.Lock()
+        self._bytes_lock      = threading.Lock()
+
+        kwargs['stream'] = True
+        super().__init__(download_queue, link, dest, **kwargs)
+
+    def _stream_download(self):
+        if not isinstance(self.destination, str) or self._transforms:  # transforms need the response in order
+            return super()._stream_download()
+
+        if not self._overwrite_existing_files and os.path.exists(self.destination):
+            raise FileExistsError(self.destination)
+
+        length = self._probe_length()
+        if length is None or length < 2 * self.min_segment_size:
+            return super()._stream_download()
+
+        if self._partial_fd is None:
+            # NOTE the validator is removed so a preallocated (and possibly sparse)
+            #      partial file is never mistaken for a resumable stream.
+            self._remove_validator()
+            self._partial_fd = open(self.destination + self.partial_suffix, 'w+b')
+            if not _preallocate(self._partial_fd, length):
+                self._partial_fd.truncate(length)  # sparse, where disk space can't be reserved
+
+        self._run_segments(self._partial_fd.fileno())
+
+        if self._hashing:  # ranges arrive out of order, so hash the finished file
+            self._partial_fd.flush()
+            self._hash_body(self._partial_fd.name)
+            try:
+                self._check_digests()
+            except IntegrityError:
+                self._ranges = []  # fetch every range again
+                raise
+
+        self._partial_fd.close()
+        os.replace(self._partial_fd.name, self.destination)
+        self._partial_fd = None
+        self._body_path  = self.destination  # for the downloads merged into this one
+
+    def _probe_length(self):
+        """find the length of the file being downloaded, returns None when it
+        can't be downloaded in ranges (including when the server rejects HEAD
+        requests). resets the ranges when the file changed."""
+        response = self._request('HEAD', self.link, headers=self.headers, params=self.params,
+                                 cookies=self.cookies, allow_redirects=True)
+        response.close()
+        if not response.ok:
+            return None  # any error with the file itself is raised by the streamed download
+
+        length       = response.headers.get('Content-Length')
+        validator    = _response_validator(response)
+        self._entity = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        if response.headers.get('Accept-Ranges', '').lower() != 'bytes' or not length or not length.isdigit():
+            return None
+        length = int(length)
+
+        if validator != self._validator or not self._ranges or self._ranges[-1][2] != length - 1:
+            self._validator = validator
+            self._ranges    = self._split(length)
+
+            if self._partial_fd is not None:
+                self._partial_fd.truncate(0)  # drop data from the old file
+                self._partial_fd.truncate(length)
+
+        return length
+
+    def _split(self, length):
+        count = max(min(self.segments, length // self.min_segment_size), 1)
+        size  = length // count
+        bounds = [X * size for X in range(count)] + [length]
+        return [[bounds[X], bounds[X], bounds[X+1] - 1] for X in range(count)]
+
+    def _run_segments(self, fd):
+        """fetch every incomplete range, using as many connections as the
+        queue has free slots for (in addition to the current one)."""
+        pending = iter([X for X in self._ranges if X[1] <= X[2]])
+        errors  = []
+
+        def run():
+            while not errors:
+                with self._ranges_lock:
+                    segment = next(pending, None)
+                if segment is None:
+                    return
+
+                try:
+                    self._download_segment(fd, segment)
+                except Exception as e:
+                    errors.append(e)
+
+        reserve = getattr(self.queue, '_reserve_slots', None)
+        helpers = reserve(len(self._ranges) - 1, self.host) if reserve else 0
+        finished = threading.Semaphore(0)
+
+        def helper():
+            try:
+                run()
+            finally:
+                finished.release()
+
+        for X in range(helpers): self.queue._submit(helper, self.host)
+        run()
+        for X in range(helpers): finished.acquire()
+
+        if errors:
+            raise errors[0]
+
+    def _download_segment(self, fd, segment):
+        """fetch the remainder of a single range and write it into fd"""
+        start, position, end = segment
+        headers = dict(self.headers, Range='bytes=%d-%d' % (position, end))
+        if self._validator:
+            headers['If-Range'] = self._validator
+
+        response = self._request('GET', self.link, headers=headers, params=self.params,
+                                 cookies=self.cookies, stream=True)
+        response.raise_for_status()
+
+        if response.status_code != 206:
+            response.close()
+            self._ranges = []  # the file changed, reprobe on the next attempt
+            raise IOError('server ignored range request for %s' % self.link)
+
+        if _parse_content_range(response.headers.get('Content-Range', ''))[0] != position:
+            response.close()
+            raise IOError('server returned the wrong range of %s' % self.link)
+
+        for chunk in self._iterate_response_chunks(response):
+            if len(chunk) > end + 1 - position:
+                chunk = chunk[:end + 1 - position]  # ignore anything past the range
+            _pwrite(fd, chunk, position)
+            position = segment[1] = position + len(chunk)
+            if position > end:
+                break
+
+        if position <= end:
+            raise IOError('connection closed before receiving bytes %d-%d of %s' % (position, end, self.link))
+
+    def _count_bytes(self, count):
+        with self._bytes_lock:  # ranges are received from several threads
+            self.bytes_received += count
+
+        metrics = self.metrics
+        if metrics is not None: metrics.received(self, count)
+
+    def serialise_args(self):
+        return super().serialise_args() + [self.segments]
+
+
+_pwrite_lock = threading.Lock()
+
+def _pwrite(fd, data, offset):
+    """write data into fd at offset without moving the shared file position"""
+    if hasattr(os, 'pwrite'):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data, offset = data[written:], offset + written
+    else:
+        with _pwrite_lock:  # seek + write isn't atomic across threads
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                data = data[os.write(fd, data):]
@@ -0,0 +1,125 @@
+import threading, time, typing
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+class SessionPool(object):
+    """thread safe collection of keep-alive http sessions, one per host.
+
+    Each host (scheme + netloc) gets its own `requests.Session` whose adapter
+    keeps up to `pool_size` connections open, so consecutive downloads from
+    the same host reuse existing TCP/TLS connections instead of performing
+    a new handshake for every file. Sessions that haven't been used for
+    `idle_timeout` seconds are closed and forgotten.
+
+    NOTE sessions in the pool never store cookies sent back by a server,
+         otherwise cookies from one download would leak into every other
+         download from the same host. Pass cookies to the downloader instead.
+
+    Parameters
+    ----------
+    pool_size
+        the maximum number of connections kept open to each host. this should
+        be at least the length of the download queue using the pool.
+    keep_alive
+        when falsy every request asks the server to close its connection once
+        the response has been sent, which disables connection reuse.
+    idle_timeout
+        how long, in seconds, a hosts session can go unused before it's evicted.
+        None disables eviction.
+    """
+    def __init__(self, pool_size: int = 10, keep_alive: bool = True,
+                 idle_timeout: typing.Optional[float] = 60.0):
+        self.pool_size    = pool_size
+        self.keep_alive   = keep_alive
+        self.idle_timeout = idle_timeout
+
+        self._sessions   = {}  # host => [session, last used time]
+        self._lock       = threading.Lock()
+        self._last_evict = time.monotonic()
+
+    def __len__(self): return len(self._sessions)
+
+    def get(self, url: str) -> Session:
+        """get the session used for requests to the host of url"""
+        host = self._host_key(url)
+        now  = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._sessions.get(host)
+            if entry is None:
+                entry = self._sessions[host] = [self._make_session(), now]
+            entry[1] = now
+
+            return entry[0]
+
+    def request(self, method: str, url: str, **kwargs):
+        """send a request through the session for the host of url. see `requests.Session.request`"""
+        return self.get(url).request(method, url, **kwargs)
+
+    def evict_idle(self):
+        """close the sessions of every host that's been idle longer than idle_timeout"""
+        with self._lock:
+            self._evict_idle(time.monotonic(), force=True)
+
+    def resize(self, pool_size: int):
+        """change the maximum number of connections kept open to each host,
+        including to the hosts which already have a session.
+
+        NOTE the adapters of existing sessions are replaced, the connections
+             of the old ones are closed once they're done with any response
+             they're receiving.
+        """
+        with self._lock:
+            self.pool_size = pool_size
+            for session, X in self._sessions.values():
+                adapters = set(session.adapters.values())
+                self._mount_adapter(session)
+                for adapter in adapters: adapter.close()
+
+    def close(self):
+        """close every session in the pool"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+
+        for session, X in sessions.values():
+            session.close()
+
+    def _evict_idle(self, now, force=False):
+        if self.idle_timeout is None:
+            return
+
+        # NOTE only scan the pool periodically so get stays cheap with many hosts
+        if not force and now - self._last_evict < self.idle_timeout:
+            return
+        self._last_evict = now
+
+        for host, (session, last_used) in list(self._sessions.items()):
+            if now - last_used > self.idle_timeout:
+                del self._sessions[host]
+                session.close()  # connections still streaming a response are closed on release
+
+    def _make_session(self):
+        session = Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))  # never store cookies
+
+        self._mount_adapter(session)
+
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
+
+    def _mount_adapter(self, session):
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    @staticmethod
+    def _host_key(url):
+        url = urlsplit(url)
+        return (url.scheme.lower(), url.netloc.lower())
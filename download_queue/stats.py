@@ -0,0 +1,164 @@
+import bisect, threading, time, typing
+
+MetricsSink = typing.Callable[[str, float], None]
+
+
+class Histogram(object):
+    """fixed size histogram with exponentially growing buckets. recording a
+    value is a single bisect, so it's cheap enough to do for every chunk.
+    percentiles are estimated from the bucket the percentile falls in.
+
+    NOTE this class isn't thread safe, see `QueueStats`.
+
+    Parameters
+    ----------
+    start
+        the upper bound of the first bucket.
+    factor
+        how much larger the upper bound of each bucket is than the one before.
+    buckets
+        the number of buckets. values larger than the last bound share a bucket.
+    """
+    def __init__(self, start: float, factor: float = 2, buckets: int = 40):
+        self.bounds = [start * factor ** X for X in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.count, self.sum = 0, 0.0
+        self.min,   self.max = None, None
+
+    def record(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum   += value
+        self.min    = value if self.min is None or value < self.min else self.min
+        self.max    = value if self.max is None or value > self.max else self.max
+
+    def percentile(self, percent: float) -> typing.Optional[float]:
+        """estimate the value below which percent% of recorded values fall"""
+        if not self.count:
+            return None
+
+        rank, seen = percent / 100 * self.count, 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[index-1] if index > 0 else 0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                value = lower + (upper - lower) * (rank - seen) / count  # interpolate within bucket
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum':   self.sum,
+            'mean':  self.sum / self.count if self.count else None,
+            'min':   self.min,
+            'max':   self.max,
+            'p50':   self.percentile(50),
+            'p90':   self.percentile(90),
+            'p99':   self.percentile(99),
+        }
+
+
+class QueueStats(object):
+    """thread safe throughput and latency statistics for a download queue.
+
+    Every :obj:`download_queue.DownloadQueue` keeps one of these as its metrics
+    attribute. Downloaders update it as they run and `DownloadQueue.stats`
+    returns a snapshot of it. The counters kept are the number of downloads
+    started, succeeded and failed, the number of retries, the bytes received by
+    finished downloads and the bytes received so far by every download, alongside
+    histograms of (in seconds) the time downloads waited in the queue, the time to
+    the first byte of every response, the duration of downloads and the time taken
+    to read every chunk, and of the throughput (bytes per second) of each download.
+
+    Parameters
+    ----------
+    chunk_timing
+        when falsy, the time taken to read each chunk isn't recorded at all,
+        leaving no per chunk overhead.
+    sink
+        called with the name and value of every metric as it's recorded, to
+        forward them to an external metrics system. it's called from the
+        downloading threads, so it should be fast and must be thread safe.
+    """
+    def __init__(self, chunk_timing: bool = True, sink: typing.Optional[MetricsSink] = None):
+        self.chunk_timing = chunk_timing
+        self.sink         = sink
+
+        self._lock    = threading.Lock()
+        self._created = time.monotonic()
+        self._counters = {
+            'started':   0,
+            'succeeded': 0,
+            'failed':    0,
+            'retries':   0,
+            'bytes':     0,
+            'received':  0,
+        }
+        self._histograms = {
+            'queue_wait':          Histogram(0.001),
+            'time_to_first_byte':  Histogram(0.001),
+            'duration':            Histogram(0.001),
+            'chunk_time':          Histogram(0.00001),
+            'throughput':          Histogram(1024),
+        }
+
+    def started(self, downloader):
+        """record that downloader has started running"""
+        self._increment('started')
+        if downloader.queued_at is not None:
+            self._observe('queue_wait', downloader.started_at - downloader.queued_at)
+
+    def finished(self, downloader):
+        """record the outcome of downloader, once it has finished running"""
+        duration = downloader.finished_at - downloader.started_at
+
+        self._increment('succeeded' if downloader.complete else 'failed')
+        self._increment('bytes', downloader.bytes_received)
+        self._observe('duration', duration)
+        if downloader.complete and duration > 0:
+            self._observe('throughput', downloader.bytes_received / duration)
+
+    def retried(self, downloader):
+        """record that downloader is retrying after a failed attempt"""
+        self._increment('retries')
+
+    def responded(self, downloader, seconds):
+        """record the time between sending a request and receiving its response"""
+        self._observe('time_to_first_byte', seconds)
+
+    def received(self, downloader, count):
+        """record that count more bytes have been received, as they arrive"""
+        self._increment('received', count)
+
+    def chunk(self, downloader, seconds):
+        """record the time taken to read a single chunk of a response"""
+        self._observe('chunk_time', seconds)
+
+    def snapshot(self) -> dict:
+        """get a copy of every counter and a summary of every histogram"""
+        with self._lock:
+            uptime   = time.monotonic() - self._created
+            finished = self._counters['succeeded'] + self._counters['failed']
+
+            snapshot = dict(self._counters)
+            snapshot.update({
+                'uptime':           uptime,
+                'bytes_per_second': self._counters['bytes'] / uptime if uptime > 0 else 0.0,
+                'failure_rate':     self._counters['failed'] / finished if finished else 0.0,
+            })
+            snapshot.update((name, X.snapshot()) for name, X in self._histograms.items())
+            return snapshot
+
+    def _increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+        if self.sink is not None:
+            self.sink(name, amount)
+
+    def _observe(self, name, value):
+        with self._lock:
+            self._histograms[name].record(value)
+        if self.sink is not None:
+            self.sink(name, value)
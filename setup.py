@@ -12,6 +12,9 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url='https://github.com/MoHKale/DownloadQueue',
     packages=setuptools.find_packages(),
+    extras_require={
+        'async': ['aiohttp'],  # download_queue.AsyncDownloadQueue
+    },
     classifiers=(
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
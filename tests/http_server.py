@@ -0,0 +1,79 @@
+"""minimal local http server used by the test suite, so tests don't need the network"""
+import threading, hashlib, time
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from benchmarks.server import RangeHandler
+
+class _Handler(RangeHandler):
+    def do_GET(self):
+        url   = urlsplit(self.path)
+        query = parse_qs(url.query)
+        body  = self.server.files.get(url.path)
+
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, dict(self.headers), self.client_address))
+
+        # ?head_status=N responds to HEAD requests with status N
+        if self.command == 'HEAD' and 'head_status' in query:
+            return self._send_empty(int(query['head_status'][0]))
+
+        # ?status=N responds with status N, and a Retry-After of ?retry_after=S seconds
+        if 'status' in query:
+            headers = {'Retry-After': query['retry_after'][0]} if 'retry_after' in query else {}
+            return self._send_empty(int(query['status'][0]), headers)
+
+        if body is None:
+            return self._send_empty(404)
+
+        # ?delay=S waits S seconds before responding
+        if 'delay' in query:
+            time.sleep(float(query['delay'][0]))
+
+        etag = '"%s"' % hashlib.sha1(body).hexdigest() if self.server.etags else None
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            return self._send_empty(304, {'ETag': etag})
+
+        start, end = self._send_head(etag, len(body))
+        if start is None or self.command == 'HEAD':
+            return
+
+        # ?truncate=N drops the connection after N bytes of a full (non range) body
+        truncate = int(query['truncate'][0]) if 'truncate' in query and start == 0 else None
+        if truncate is not None:
+            self.wfile.write(body[:truncate])
+            self.close_connection = True
+        else:
+            self.wfile.write(body[start:end + 1])
+
+class LocalServer(object):
+    """serves the bytes in files (a mapping of path to body) on localhost
+    from a background thread. every request received is recorded in requests.
+
+    when ranges is truthy, Range requests for 'bytes=N-' or 'bytes=N-M' are honoured and
+    when etags is truthy every response carries an ETag.
+    """
+    def __init__(self, files=None, ranges=True, etags=True):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.files    = files if files is not None else {}
+        self.httpd.requests = []
+        self.httpd.lock     = threading.Lock()
+        self.httpd.ranges   = ranges
+        self.httpd.etags    = etags
+
+    @property
+    def files(self): return self.httpd.files
+
+    @property
+    def requests(self): return self.httpd.requests
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.httpd.server_address[1], path)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,91 @@
+import unittest, threading, time
+from download_queue import DownloadQueue, AdaptiveConcurrency
+from test_download_queue import HostRecorder, Record
+
+def stats(uptime, received=0, retries=0, pending=1, responses=0, latency=0.0):
+    return {'uptime': uptime, 'received': received, 'retries': retries, 'pending': pending,
+            'time_to_first_byte': {'count': responses, 'sum': responses * latency}}
+
+def wait_until(condition, timeout=5.0):
+    """poll condition until it's true, returning False if it wasn't within timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def test_grows_while_throughput_rises(self):
+        adaptive = AdaptiveConcurrency(max_length=3)
+
+        self.assertEqual(1, adaptive.update(1, stats(0)))
+        self.assertEqual(2, adaptive.update(1, stats(1, received=100)))
+        self.assertEqual(3, adaptive.update(2, stats(2, received=300)))
+        self.assertEqual(3, adaptive.update(3, stats(3, received=600)))  # at max_length
+
+    def test_holds_without_rising_throughput_or_waiting_downloads(self):
+        adaptive = AdaptiveConcurrency()
+
+        adaptive.update(4, stats(0))
+        adaptive.update(4, stats(1, received=100))
+        self.assertEqual(4, adaptive.update(4, stats(2, received=200)))
+        self.assertEqual(4, adaptive.update(4, stats(3, received=400, pending=0)))
+
+    def test_shrinks_on_retries(self):
+        adaptive = AdaptiveConcurrency(min_length=2)
+
+        adaptive.update(8, stats(0))
+        self.assertEqual(4, adaptive.update(8, stats(1, received=100, retries=1)))
+        self.assertEqual(2, adaptive.update(3, stats(2, received=300, retries=2)))
+
+    def test_shrinks_on_rising_latency(self):
+        adaptive = AdaptiveConcurrency()
+
+        adaptive.update(8, stats(0))
+        adaptive.update(8, stats(1, received=100, responses=10, latency=0.1))
+        self.assertEqual(4, adaptive.update(8, stats(2, received=300, responses=20, latency=0.5)))
+
+class TestResize(unittest.TestCase):
+    def test_resize_while_running(self):
+        record = Record()
+
+        with DownloadQueue(1, backlog=20) as queue:
+            for X in range(12):
+                queue.add(0.05, record, host='a', download_class=HostRecorder)
+
+            time.sleep(0.02)
+            queue.resize(4)
+            self.assertTrue(wait_until(lambda: record.peak['a'] == 4))
+
+            queue.resize(1)
+            self.assertTrue(wait_until(lambda: queue.stats()['active'] <= 1))  # the downloads already running finish
+            record.peak.clear()
+        queue.close()
+
+        self.assertEqual(12, len(record))
+        self.assertEqual({'a': 1}, record.peak)
+        self.assertEqual(1, queue.stats()['capacity'])
+
+    def test_adaptive_queue_grows(self):
+        class Receiver(HostRecorder):
+            def _download(self):
+                super()._download()
+                self._count_bytes(1000)
+
+        record, lengths = Record(), []
+        adaptive        = AdaptiveConcurrency(max_length=4, interval=0.02)
+        thread_count    = threading.active_count()
+
+        with DownloadQueue(1, adaptive=adaptive) as queue:
+            for X in range(40):
+                queue.add(0.01, record, download_class=Receiver)
+                lengths.append(queue.max_length)
+        queue.close()
+
+        self.assertEqual(40, len(record))
+        self.assertGreater(max(lengths), 1)
+        self.assertLessEqual(max(lengths), 4)
+
+        time.sleep(0.05)  # the adapter thread stops with the queue
+        self.assertEqual(thread_count, threading.active_count())
@@ -0,0 +1,36 @@
+import unittest, io, os, tempfile
+from download_queue import aio, AsyncDownloadQueue
+from http_server import LocalServer
+
+@unittest.skipUnless(aio.aiohttp, 'aiohttp is not installed')
+class TestAsyncDownloadQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = LocalServer({'/%d' % X: os.urandom(2 ** 12) for X in range(20)}).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    async def test_queue_downloads_files(self):
+        destinations = {}
+
+        async with AsyncDownloadQueue(5) as queue:
+            for path in self.server.files:
+                destinations[path] = io.BytesIO()
+                await queue.add(self.server.url(path), destinations[path], close_fd=False)
+                self.assertLessEqual(queue.length, 5)
+
+        self.assertEqual(0, queue.length)
+        for path, body in self.server.files.items():
+            self.assertEqual(body, destinations[path].getvalue())
+
+    async def test_failed_download_is_retried(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dest = os.path.join(tmpdir, 'missing')
+
+            async with AsyncDownloadQueue(1) as queue:
+                downloader = aio.AsyncGenericDownloader(queue, self.server.url('/error?status=503'), dest,
+                                                        attempt_count=3, attempt_interval=0)
+                await downloader.download()
+
+            self.assertFalse(downloader.complete)
+            self.assertEqual(3, len(self.server.requests))
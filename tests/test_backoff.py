@@ -0,0 +1,69 @@
+import unittest, io, os, time
+import requests
+from download_queue import DownloadQueue
+from download_queue.backoff import ExponentialBackoff, ConstantBackoff, is_retryable, retry_after
+from http_server import LocalServer
+
+def http_error(status, headers={}):
+    response = requests.Response()
+    response.status_code, response.headers = status, requests.structures.CaseInsensitiveDict(headers)
+    return requests.HTTPError(response=response)
+
+class TestBackoff(unittest.TestCase):
+    def test_exponential_backoff(self):
+        backoff = ExponentialBackoff(base=1, factor=2, cap=5, jitter=None)
+
+        self.assertEqual([1, 2, 4, 5, 5], [backoff.delay(X, None) for X in range(1, 6)])
+
+    def test_jitter_stays_within_bounds(self):
+        for jitter, low, high in [('full', 0, 4), ('equal', 2, 4), ('decorrelated', 1, 6)]:
+            backoff = ExponentialBackoff(base=1, cap=60, jitter=jitter)
+            for X in range(100):
+                self.assertTrue(low <= backoff.delay(3, 2) <= high, jitter)
+
+    def test_unknown_jitter(self):
+        with self.assertRaises(ValueError):
+            ExponentialBackoff(jitter='sideways')
+
+    def test_retryable_errors(self):
+        self.assertFalse(is_retryable(http_error(404)))
+        self.assertFalse(is_retryable(FileExistsError('dest')))
+        self.assertTrue(is_retryable(http_error(429)))
+        self.assertTrue(is_retryable(http_error(503)))
+        self.assertTrue(is_retryable(requests.ConnectionError()))
+
+    def test_retry_after(self):
+        self.assertEqual(7, retry_after(http_error(503, {'Retry-After': '7'})))
+        self.assertEqual(0, retry_after(http_error(503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})))
+        self.assertIsNone(retry_after(http_error(503, {'Retry-After': 'soon'})))
+        self.assertIsNone(retry_after(http_error(503)))
+
+class TestQueueRetries(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer({'/file': os.urandom(2 ** 10)}).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_waiting_retry_releases_its_slot(self):
+        with DownloadQueue(1, backlog=5) as queue:
+            failing = queue.add(self.server.url('/error?status=503'), io.BytesIO(),
+                                attempt_count=2, attempt_backoff=ConstantBackoff(0.3))
+            time.sleep(0.1)  # first attempt has failed, the retry is waiting
+            passing = queue.add(self.server.url('/file'), io.BytesIO())
+
+            passing.result(timeout=0.2)
+            self.assertFalse(failing.done())
+        queue.close()
+
+        self.assertIsInstance(failing.exception(), requests.HTTPError)
+        self.assertEqual(1, queue.stats()['retries'])
+
+    def test_retry_after_is_respected(self):
+        with DownloadQueue(1) as queue:
+            future = queue.add(self.server.url('/error?status=429&retry_after=1'), io.BytesIO(),
+                               attempt_count=2, attempt_interval=0)
+        queue.close()
+
+        self.assertGreaterEqual(future.elapsed, 1)
+        self.assertEqual(2, len(self.server.requests))
@@ -0,0 +1,13 @@
+import unittest
+from benchmarks.run import run_scenario
+from benchmarks.scenarios import SCENARIOS, scaled
+
+class TestBenchmarks(unittest.TestCase):
+    def test_scenarios_run(self):
+        for name in ('small_files', 'flaky_origin', 'many_hosts'):
+            result = run_scenario(scaled(SCENARIOS[name], 0.01))
+
+            self.assertEqual(result['downloads'], result['succeeded'], name)
+            self.assertEqual(result['downloads'] * SCENARIOS[name].size, result['bytes'], name)
+            self.assertGreater(result['peak_threads'], 1)
+            self.assertLessEqual(result['latency_p50'], result['latency_p99'])
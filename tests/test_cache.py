@@ -0,0 +1,165 @@
+import unittest, io, os, tempfile
+from download_queue import DownloadQueue, ResponseCache
+from http_server import LocalServer
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache     = ResponseCache(os.path.join(self.directory.name, 'cache'), max_size=100)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_and_lookup(self):
+        entry = self.cache.store('http://example.com/a', b'a' * 10, etag='"a"')
+
+        self.assertEqual(entry, self.cache.lookup('http://example.com/a'))
+        self.assertEqual(10, entry.size)
+        self.assertIsNone(self.cache.lookup('http://example.com/b'))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for name in 'abc':
+            self.cache.store('http://example.com/' + name, b'x' * 40, etag=name)
+            self.cache.lookup('http://example.com/a')  # keep a in use
+
+        self.assertIn('http://example.com/a', self.cache)
+        self.assertNotIn('http://example.com/b', self.cache)
+        self.assertEqual(80, self.cache.size)
+
+    def test_entries_persist(self):
+        self.cache.store('http://example.com/a', b'a' * 10, last_modified='yesterday')
+        cache = ResponseCache(self.cache.directory)
+
+        self.assertEqual('yesterday', cache.lookup('http://example.com/a').last_modified)
+
+class TestCachedDownloads(unittest.TestCase):
+    def setUp(self):
+        self.body      = os.urandom(2 ** 12)
+        self.server    = LocalServer({'/file': self.body}).__enter__()
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache     = ResponseCache(os.path.join(self.directory.name, 'cache'), hard_links=True)
+
+    def tearDown(self):
+        self.server.__exit__()
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_unchanged_response_is_copied_from_cache(self):
+        for stream in (False, True):
+            with DownloadQueue(2, cache=self.cache) as queue:
+                first = queue.add(self.server.url('/file'), self.path('first%s' % stream), stream=stream)
+            with DownloadQueue(2, cache=self.cache, deduplicate=False) as queue:
+                second = queue.add(self.server.url('/file'), self.path('second%s' % stream), stream=stream)
+                fd     = io.BytesIO()
+                third  = queue.add(self.server.url('/file'), fd, close_fd=False, stream=stream)
+
+            for future in (first, second, third): future.result()
+            with open(self.path('second%s' % stream), 'rb') as fd2:
+                self.assertEqual(self.body, fd2.read())
+            self.assertEqual(self.body, fd.getvalue())
+            self.assertEqual(0, second.bytes_transferred)
+
+            self.cache.clear()
+
+        statuses = [X[2].get('If-None-Match') is not None for X in self.server.requests]
+        self.assertEqual([False, True, True] * 2, statuses)
+
+    def test_changed_response_is_downloaded(self):
+        with DownloadQueue(1, cache=self.cache) as queue:
+            queue.add(self.server.url('/file'), self.path('first'))
+
+        self.server.files['/file'] = body = os.urandom(2 ** 10)
+        with DownloadQueue(1, cache=self.cache) as queue:
+            future = queue.add(self.server.url('/file'), self.path('second'))
+
+        self.assertEqual(len(body), future.bytes_transferred)
+        with open(self.path('second'), 'rb') as fd:
+            self.assertEqual(body, fd.read())
+        self.assertEqual(len(body), self.cache.size)
+
+class TestDeduplication(unittest.TestCase):
+    def setUp(self):
+        self.body   = os.urandom(2 ** 12)
+        self.server = LocalServer({'/file': self.body}).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_concurrent_downloads_are_merged(self):
+        url = self.server.url('/file?delay=0.2')
+        with tempfile.TemporaryDirectory() as directory, DownloadQueue(4) as queue:
+            buffers = [io.BytesIO() for X in range(3)]
+            futures = [queue.add(url, X, close_fd=False) for X in buffers]
+            futures.append(queue.add(url, os.path.join(directory, 'file'), stream=True))
+            futures.append(queue.add(url, io.BytesIO(), headers={'Accept': 'text/plain'}))
+            queue.wait()
+
+            with open(os.path.join(directory, 'file'), 'rb') as fd:
+                self.assertEqual(self.body, fd.read())
+
+        self.assertTrue(all(X.exception() is None for X in futures))
+        self.assertEqual([self.body] * 3, [X.getvalue() for X in buffers])
+        self.assertEqual(2, len(self.server.requests))  # one for each set of headers
+
+    def test_merged_downloads_share_failures(self):
+        url = self.server.url('/file?status=404&delay=0.2')
+        with DownloadQueue(2) as queue:
+            futures = [queue.add(url, io.BytesIO()) for X in range(3)]
+
+        self.assertEqual(1, len(self.server.requests))
+        self.assertTrue(all(X.exception() is futures[0].exception() for X in futures))
+
+    def test_merged_downloads_copy_body_source_failed_to_write(self):
+        url = self.server.url('/file?delay=0.2')
+        for stream in (False, True):
+            with tempfile.TemporaryDirectory() as directory, DownloadQueue(2) as queue:
+                exists, target = os.path.join(directory, 'exists'), os.path.join(directory, 'target')
+                with open(exists, 'wb'): pass
+
+                failed = queue.add(url, exists, stream=stream)
+                copied = queue.add(url, target, stream=stream)
+                queue.wait()
+
+                self.assertIsInstance(failed.exception(), FileExistsError)
+                self.assertIsNone(copied.exception())
+                with open(target, 'rb') as fd:
+                    self.assertEqual(self.body, fd.read())
+            queue.close()
+        self.assertEqual(2, len(self.server.requests))  # one for each run
+
+    def test_merged_downloads_are_fetched_again_when_source_fails_verification(self):
+        url = self.server.url('/file?delay=0.2')
+        with DownloadQueue(2) as queue:
+            failed = queue.add(url, io.BytesIO(), verify={'sha256': '0' * 64}, attempt_count=1)
+            copied = queue.add(url, io.BytesIO(), close_fd=False)
+        queue.close()
+
+        self.assertIsNotNone(failed.exception())
+        self.assertEqual(self.body, copied.result().destination.getvalue())
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_cancelled_download_hands_over_to_merged_ones(self):
+        url = self.server.url('/file')
+        with DownloadQueue(1, backlog=5) as queue:
+            queue.add(self.server.url('/file?delay=0.2'), io.BytesIO())  # occupy the only slot
+            first  = queue.add(url, io.BytesIO())
+            second = queue.add(url, io.BytesIO(), close_fd=False)
+            first.cancel()
+
+        self.assertEqual(self.body, second.result().destination.getvalue())
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_deduplication_can_be_disabled(self):
+        with DownloadQueue(2, deduplicate=False) as queue:
+            for X in range(2): queue.add(self.server.url('/file?delay=0.1'), io.BytesIO())
+
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_malformed_link_leaves_queue_finished(self):
+        with DownloadQueue(1) as queue:
+            with self.assertRaises(ValueError):  # requests.exceptions.InvalidURL
+                queue.add('not a url', io.BytesIO())
+            self.assertTrue(queue.wait(2))
+        queue.close()
@@ -0,0 +1,173 @@
+import unittest, threading, time, gc, queue as stdqueue
+from download_queue import DownloadQueue, HostLimit
+from download_queue.downloader import Downloader
+
+class SleepDownloader(Downloader):
+    """downloader which doesn't touch the network, it just records the thread it ran on"""
+    def __init__(self, download_queue, delay, record, host=None, **kwargs):
+        self.delay, self.record, self._host = delay, record, host
+        super().__init__(download_queue, **kwargs)
+
+    @property
+    def host(self): return self._host
+
+    def _download(self):
+        time.sleep(self.delay)
+        self.record.append(threading.current_thread())
+
+    def serialise_args(self):
+        return [self.delay]
+
+class TestDownloadQueue(unittest.TestCase):
+    def test_queue_reuses_worker_threads(self):
+        gc.collect()  # stop the workers of queues other tests left to be collected
+        record, thread_count = [], threading.active_count()
+
+        with DownloadQueue(3) as queue:
+            self.assertEqual(thread_count + 3, threading.active_count())
+
+            for X in range(20):
+                queue.add(0.01, record, download_class=SleepDownloader)
+
+        self.assertEqual(20, len(record))
+        self.assertLessEqual(len(set(record)), 3)
+        self.assertEqual(thread_count + 3, threading.active_count())
+
+        queue.close()
+        self.assertEqual(thread_count, threading.active_count())
+
+    def test_queue_length_returns_to_zero(self):
+        record = []
+
+        with DownloadQueue(2) as queue:
+            for X in range(5):
+                queue.add(0, record, download_class=SleepDownloader)
+
+        self.assertEqual(0, queue.length)
+        self.assertEqual(5, len(record))
+
+    def test_closed_queue_rejects_downloads(self):
+        queue = DownloadQueue(1)
+        queue.close()
+
+        with self.assertRaises(RuntimeError):
+            queue.add(0, [], download_class=SleepDownloader)
+
+class HostRecorder(SleepDownloader):
+    """records the host of every download and how many ran at once for each host"""
+    lock = threading.Lock()
+
+    def _download(self):
+        with self.lock:
+            self.record.active[self.host] = self.record.active.get(self.host, 0) + 1
+            self.record.peak[self.host] = max(self.record.peak.get(self.host, 0), self.record.active[self.host])
+
+        time.sleep(self.delay)
+
+        with self.lock:
+            self.record.active[self.host] -= 1
+            self.record.append((self.host, time.monotonic()))
+
+class Record(list):
+    def __init__(self):
+        self.active, self.peak = {}, {}
+
+class TestHostLimits(unittest.TestCase):
+    def test_max_connections_per_host(self):
+        record = Record()
+
+        with DownloadQueue(4, host_limit=HostLimit(max_connections=2)) as queue:
+            for X in range(8):
+                queue.add(0.02, record, host='a' if X % 2 else 'b', download_class=HostRecorder)
+        queue.close()
+
+        self.assertEqual({'a': 2, 'b': 2}, record.peak)
+
+    def test_saturated_host_doesnt_hold_slots(self):
+        record = Record()
+
+        with DownloadQueue(2, host_limits={'slow': HostLimit(max_connections=1)}) as queue:
+            queue.add(0.2, record, host='slow', download_class=HostRecorder)
+            queue.add(0.2, record, host='slow', download_class=HostRecorder)
+            for X in range(2):
+                queue.add(0.01, record, host='fast', download_class=HostRecorder)
+        queue.close()
+
+        # both fast downloads finish while the first slow one is still running
+        self.assertEqual(['fast', 'fast', 'slow', 'slow'], [X[0] for X in record])
+
+    def test_requests_per_second(self):
+        record = Record()
+        start  = time.monotonic()
+
+        with DownloadQueue(5, host_limit=HostLimit(requests_per_second=20, burst=1)) as queue:
+            for X in range(5):
+                queue.add(0, record, host='a', download_class=HostRecorder)
+        queue.close()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        self.assertEqual(5, len(record))
+
+class TestBacklog(unittest.TestCase):
+    def test_non_blocking_add_on_full_backlog(self):
+        record = []
+
+        with DownloadQueue(1, backlog=2) as queue:
+            queue.add(0.2, record, download_class=SleepDownloader)
+            time.sleep(0.05)  # let it start running
+
+            queue.add(0, record, download_class=SleepDownloader, block=False)
+            queue.add(0, record, download_class=SleepDownloader, block=False)
+            self.assertFalse(queue.ready)
+
+            with self.assertRaises(stdqueue.Full):
+                queue.add(0, record, download_class=SleepDownloader, block=False)
+            with self.assertRaises(stdqueue.Full):
+                queue.add(0, record, download_class=SleepDownloader, timeout=0.01)
+        queue.close()
+
+        self.assertEqual(3, len(record))
+
+    def test_priorities(self):
+        record = Record()
+
+        with DownloadQueue(1, backlog=10) as queue:
+            queue.add(0.1, record, download_class=SleepDownloader)
+            time.sleep(0.05)
+
+            for priority in [0, 5, 1, 5]:
+                queue.add(0, record, download_class=HostRecorder, host=priority, priority=priority)
+        queue.close()
+
+        self.assertEqual([5, 5, 1, 0], [X[0] for X in record[1:]])
+
+    def test_add_many_consumes_lazily(self):
+        record, produced = Record(), []
+
+        def downloads():
+            for X in range(20):
+                produced.append(X)
+                yield (0.01, record)
+
+        with DownloadQueue(2, backlog=3) as queue:
+            thread = threading.Thread(target=queue.add_many, args=(downloads(),),
+                                      kwargs={'download_class': HostRecorder})
+            thread.start()
+            time.sleep(0.005)
+            self.assertLessEqual(len(produced), 2 + 3 + 1)
+            thread.join()
+        queue.close()
+
+        self.assertEqual(20, len(record))
+
+    def test_add_many_with_keyword_arguments(self):
+        record = Record()
+
+        with DownloadQueue(2) as queue:
+            count = queue.add_many([{'delay': 0, 'record': record, 'host': 'a'}, (0, record)],
+                                   download_class=HostRecorder)
+        queue.close()
+
+        self.assertEqual(2, count)
+        self.assertEqual([None, 'a'], sorted([X[0] for X in record], key=str))
+
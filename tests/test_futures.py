@@ -0,0 +1,65 @@
+import unittest, io, os
+import requests
+from download_queue import DownloadQueue, DownloadFuture
+from http_server import LocalServer
+
+class TestDownloadFutures(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer({'/%d' % X: os.urandom(2 ** 12) for X in range(10)}).__enter__()
+        self.queue  = DownloadQueue(2, backlog=20)
+
+    def tearDown(self):
+        self.queue.close()
+        self.server.__exit__()
+
+    def test_future_result(self):
+        future = self.queue.add(self.server.url('/0'), io.BytesIO(), close_fd=False)
+
+        self.assertIsInstance(future, DownloadFuture)
+        downloader = future.result(timeout=5)
+        self.assertEqual(self.server.files['/0'], downloader.destination.getvalue())
+        self.assertEqual(2 ** 12, future.bytes_transferred)
+        self.assertGreater(future.elapsed, 0)
+
+    def test_future_exception(self):
+        future = self.queue.add(self.server.url('/missing'), io.BytesIO(), attempt_count=1)
+
+        self.assertIsInstance(future.exception(timeout=5), requests.HTTPError)
+        self.assertFalse(future.downloader.complete)
+
+    def test_as_completed_yields_every_download(self):
+        futures = [self.queue.add(self.server.url(path), io.BytesIO()) for path in self.server.files]
+        futures.append(self.queue.add(self.server.url('/missing'), io.BytesIO(), attempt_count=1))
+
+        finished = list(self.queue.as_completed(timeout=10))
+
+        self.assertEqual(set(futures), set(finished))
+        self.assertEqual(1, len([X for X in finished if X.exception()]))
+
+    def test_as_completed_yields_downloads_finished_before_iterating(self):
+        futures = [self.queue.add(self.server.url(path), io.BytesIO()) for path in self.server.files]
+        self.assertTrue(self.queue.wait(10))
+
+        self.assertEqual(set(futures), set(self.queue.as_completed(timeout=10)))
+        self.assertEqual([], list(self.queue.as_completed(timeout=10)))  # each is only yielded once
+
+    def test_as_completed_with_given_futures(self):
+        futures = [self.queue.add(self.server.url('/%d' % X), io.BytesIO()) for X in range(3)]
+
+        self.assertEqual(set(futures), set(self.queue.as_completed(futures, timeout=10)))
+
+    def test_wait_times_out(self):
+        future = self.queue.add(self.server.url('/error?status=503'), io.BytesIO(), attempt_count=2, attempt_interval=1)
+
+        self.assertFalse(self.queue.wait(timeout=0.05))
+        self.assertTrue(self.queue.wait(timeout=5))
+        self.assertTrue(future.done())
+
+    def test_cancelled_download_never_runs(self):
+        for X in range(2):  # occupy both slots
+            self.queue.add(self.server.url('/error?status=503'), io.BytesIO(), attempt_count=2, attempt_interval=0.2)
+        future = self.queue.add(self.server.url('/0'), io.BytesIO())
+
+        self.assertTrue(future.cancel())
+        self.assertTrue(self.queue.wait(timeout=5))
+        self.assertEqual(0, len([X for X in self.server.requests if X[1] == '/0']))
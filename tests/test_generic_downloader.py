@@ -1,6 +1,7 @@
 import unittest, io, requests, traceback
 from hashlib import sha256
 from download_queue import GenericDownloader, DownloadQueue
+from http_server import LocalServer
 
 class TestGenericDownloader(unittest.TestCase):
     @classmethod
@@ -12,7 +13,13 @@ class TestGenericDownloader(unittest.TestCase):
             'https://www.google.co.uk/images/branding/googlelogo/1x/googlelogo_color_272x92dp.png',
             '5776cd87617eacec3bc00ebcf530d1924026033eda852f706c1a675a98915826'
         )
-        cls.invalid_download_target = 'http://google.co.uk/404'
+        cls.server = LocalServer().__enter__()
+        cls.invalid_download_target = cls.server.url('/unavailable?status=503')
+        cls.missing_download_target = cls.server.url('/404')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__()
 
     def _hash_bytes_io(self, bytes_io):
         m = sha256()
@@ -48,3 +55,15 @@ class TestGenericDownloader(unittest.TestCase):
 
         exc_count = len([X for X in tb_list if X == err_msg])
         self.assertEqual(attempt_count, exc_count)
+
+    def test_downloader_doesnt_retry_client_errors(self):
+        queue = DownloadQueue()
+
+        destination = io.BytesIO()
+        downloader  = GenericDownloader(queue, self.missing_download_target, destination,
+                                        attempt_interval=0, attempt_count=3)
+
+        with self.assertRaises(requests.HTTPError):
+            downloader._download()
+        self.assertEqual(1, len([X for X in self.server.requests if X[1] == '/404']))
+
@@ -0,0 +1,59 @@
+import unittest, hashlib, io, os, tempfile
+from download_queue import DownloadQueue, SegmentedDownloader, IntegrityError
+from http_server import LocalServer
+
+class TestIntegrity(unittest.TestCase):
+    def setUp(self):
+        self.body      = os.urandom(2 ** 16)
+        self.sha256    = hashlib.sha256(self.body).hexdigest()
+        self.server    = LocalServer({'/file': self.body}).__enter__()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.__exit__()
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_digests_are_computed(self):
+        for stream in (False, True):
+            with DownloadQueue(1) as queue:
+                future = queue.add(self.server.url('/file'), self.path('file%s' % stream), stream=stream,
+                                   verify={'sha256': self.sha256.upper(), 'size': len(self.body)}, hashes=['md5'])
+
+            downloader = future.result()
+            self.assertEqual({'sha256': self.sha256, 'md5': hashlib.md5(self.body).hexdigest()}, downloader.digests)
+
+    def test_mismatch_is_retried_then_fails(self):
+        for verify in ({'sha256': '0' * 64}, {'size': 10}):
+            with DownloadQueue(1) as queue:
+                future = queue.add(self.server.url('/file'), self.path('file'), stream=True, verify=verify,
+                                   attempt_count=2, attempt_interval=0, delete_failed_fd=True)
+
+            with self.assertRaises(IntegrityError):
+                future.result()
+            self.assertEqual(2, len([X for X in self.server.requests if X[1] == '/file']))
+            self.assertFalse(os.path.exists(self.path('file')))
+            self.server.requests.clear()
+
+    def test_resumed_stream_is_hashed_whole(self):
+        with DownloadQueue(1) as queue:
+            future = queue.add(self.server.url('/file?truncate=1000'), io.BytesIO(), close_fd=False, stream=True,
+                               chunk_size=100, verify={'sha256': self.sha256}, attempt_interval=0)
+
+        self.assertEqual(self.sha256, future.result().digests['sha256'])
+        self.assertEqual(self.body, future.result().destination.getvalue())
+        self.assertEqual('bytes=1000-', self.server.requests[-1][2].get('Range'))
+
+    def test_segmented_download_is_verified(self):
+        with DownloadQueue(4) as queue:
+            future = queue.add(self.server.url('/file'), self.path('file'), min_segment_size=2 ** 12,
+                               verify={'sha256': self.sha256}, download_class=SegmentedDownloader)
+
+        self.assertEqual(self.sha256, future.result().digests['sha256'])
+
+    def test_unknown_algorithm_is_rejected(self):
+        with DownloadQueue(1) as queue:
+            with self.assertRaises(ValueError):
+                queue.add(self.server.url('/file'), io.BytesIO(), hashes=['nope'])
@@ -0,0 +1,85 @@
+import unittest, io, os, tempfile, threading
+from download_queue import DownloadQueue, Journal
+from http_server import LocalServer
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path      = os.path.join(self.directory.name, 'journal.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_changes_are_written_in_batches(self):
+        journal = Journal(self.path, flush_interval=60, batch_size=10**6)
+        key, payload = Journal.encode(io.BytesIO, ['http://example.com'], {'stream': True})
+        journal.record(key, payload)
+        journal.update(key, 'active', bytes=10)
+        journal.update(key, 'done', bytes=20)
+
+        self.assertEqual('done', journal.state(key))
+        self.assertIsNone(Journal(self.path).state(key))  # not written yet
+
+        journal.close()
+        reopened = Journal(self.path)
+        self.assertEqual('done', reopened.state(key))
+        self.assertEqual({'done': 1}, {X: Y for X, Y in reopened.counts().items() if Y})
+        reopened.close()
+
+    def test_encoding(self):
+        key, payload = Journal.encode(DownloadQueue, ('a', 1), {'b': [2]})
+
+        self.assertEqual(key, Journal.encode(DownloadQueue, ['a', 1], {'b': [2]})[0])
+        self.assertEqual((DownloadQueue, ['a', 1], {'b': [2]}), Journal.decode(payload))
+        self.assertIsNone(Journal.encode(DownloadQueue, (io.BytesIO(),), {}))
+
+class TestJournaledQueue(unittest.TestCase):
+    def setUp(self):
+        self.body      = os.urandom(2 ** 12)
+        self.server    = LocalServer({'/file': self.body, '/other': self.body}).__enter__()
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal   = os.path.join(self.directory.name, 'journal.db')
+
+    def tearDown(self):
+        self.server.__exit__()
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_finished_downloads_are_skipped(self):
+        queue = DownloadQueue(2, journal=self.journal)
+        queue.add(self.server.url('/file'), self.path('file'))
+        queue.close()
+
+        queue  = DownloadQueue(2, journal=self.journal)
+        future = queue.add(self.server.url('/file'), self.path('file'))
+        other  = queue.add(self.server.url('/other'), self.path('other'))
+        queue.close()
+
+        self.assertTrue(future.result().complete)
+        self.assertTrue(other.result().complete)
+        self.assertEqual(['/file', '/other'], [X[1] for X in self.server.requests])
+
+    def test_unfinished_downloads_are_resumed(self):
+        # a queue which is never closed, as though its process crashed
+        journal = Journal(self.journal)
+        blocker = threading.Event()
+        crashed = DownloadQueue(1, journal=journal, backlog=5)
+        crashed._scheduler.put(blocker.wait)  # keeps the only worker busy
+        crashed.add(self.server.url('/file'), self.path('file'), stream=True)
+        crashed.add(self.server.url('/other'), self.path('other'))
+        journal.flush()
+
+        queue = DownloadQueue(2, journal=self.journal)
+        self.assertEqual(2, queue.length)
+        queue.close()
+
+        for name in ('file', 'other'):
+            with open(self.path(name), 'rb') as fd:
+                self.assertEqual(self.body, fd.read())
+
+        reopened = Journal(self.journal)
+        self.assertEqual(2, reopened.counts()['done'])
+        reopened.close()
+        blocker.set()
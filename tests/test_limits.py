@@ -0,0 +1,94 @@
+import unittest, time, threading, io, os
+from download_queue import TokenBucket, DownloadQueue
+from http_server import LocalServer
+
+class TestTokenBucket(unittest.TestCase):
+    def test_bucket_starts_full(self):
+        bucket = TokenBucket(10, 5)
+
+        for X in range(5):
+            self.assertEqual(0, bucket.try_consume())
+        self.assertAlmostEqual(0.1, bucket.try_consume(), places=2)
+
+    def test_consume_blocks_until_refilled(self):
+        bucket = TokenBucket(100, 1)
+        start  = time.monotonic()
+
+        for X in range(6):
+            bucket.consume()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+
+    def test_consume_more_than_capacity(self):
+        bucket = TokenBucket(1000, 10)
+        start  = time.monotonic()
+
+        bucket.consume(60)
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+
+    def test_rate_can_change(self):
+        bucket = TokenBucket(1, 1)
+        bucket.consume()
+
+        bucket.rate = 1000
+        self.assertLess(bucket.delay(), 0.01)
+
+    def test_throttle_is_fair(self):
+        bucket, granted, barrier = TokenBucket(1000, 10), [], threading.Barrier(4)
+
+        def consume(name):
+            barrier.wait()
+            for X in range(5):
+                bucket.throttle(20)
+                granted.append(name)
+
+        threads = [threading.Thread(target=consume, args=(X,)) for X in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        # the threads take turns, so none finishes before the others are well under way
+        first_done = min(max(X for X, Y in enumerate(granted) if Y == name) for name in range(4))
+        for name in range(4):
+            self.assertGreaterEqual(granted[:first_done].count(name), 3)
+
+    def test_throttle_sees_new_rate(self):
+        bucket = TokenBucket(1, 1)
+        bucket.throttle(1)
+        threading.Timer(0.05, setattr, (bucket, 'rate', 1000)).start()
+
+        start = time.monotonic()
+        bucket.throttle(10)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+class TestBandwidth(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer({'/file': os.urandom(2 ** 16)}).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def download(self, count, **kwargs):
+        start = time.monotonic()
+        with DownloadQueue(count, **kwargs.pop('queue', {})) as queue:
+            for X in range(count):
+                queue.add(self.server.url('/file?copy=%d' % X), io.BytesIO(), chunk_size=2 ** 12, **kwargs)
+        return time.monotonic() - start
+
+    def test_queue_bandwidth(self):
+        self.assertGreaterEqual(self.download(2, queue={'bandwidth': 2 ** 18}), 0.4)
+
+    def test_download_bandwidth(self):
+        self.assertGreaterEqual(self.download(2, bandwidth=2 ** 18), 0.12)
+
+    def test_bandwidth_can_change(self):
+        queue = DownloadQueue(1, bandwidth=2 ** 10)
+        self.assertEqual(2 ** 10, queue.bandwidth)
+
+        start = time.monotonic()
+        queue.add(self.server.url('/file'), io.BytesIO(), chunk_size=2 ** 12)
+        time.sleep(0.1)
+        queue.bandwidth = None
+        queue.close()
+
+        self.assertIsNone(queue.bandwidth)
+        self.assertLess(time.monotonic() - start, 1)
@@ -0,0 +1,79 @@
+import unittest, io, os, tempfile
+from download_queue import DownloadQueue, MemoryBudget
+from download_queue.buffers import SpillBuffer, RESERVE_BLOCK
+from http_server import LocalServer
+
+class TestSpillBuffer(unittest.TestCase):
+    def test_buffer_spills_past_budget(self):
+        budget = MemoryBudget(2 * RESERVE_BLOCK)
+        buffer = SpillBuffer(budget)
+
+        buffer.write(b'a' * RESERVE_BLOCK)
+        self.assertEqual(RESERVE_BLOCK, budget.used)
+        self.assertIsNone(buffer.path)
+
+        buffer.write(b'b' * 2 * RESERVE_BLOCK)
+        self.assertTrue(os.path.exists(buffer.path))
+        self.assertEqual(0, budget.used)
+        self.assertEqual(b'a' * RESERVE_BLOCK + b'b' * 2 * RESERVE_BLOCK, buffer.getvalue())
+
+        buffer.close()
+        self.assertFalse(os.path.exists(buffer.path))
+        self.assertEqual(1, budget.spills)
+
+    def test_truncate_gives_back_budget(self):
+        budget = MemoryBudget()
+        buffer = SpillBuffer(budget)
+
+        buffer.write(b'a' * 3 * RESERVE_BLOCK)
+        buffer.seek(0)
+        buffer.truncate()
+        self.assertEqual(0, budget.used)
+        self.assertEqual(3 * RESERVE_BLOCK, budget.peak)
+
+class TestMemoryBudget(unittest.TestCase):
+    def setUp(self):
+        self.files     = {'/%d' % X: os.urandom(2 ** 18) for X in range(4)}
+        self.server    = LocalServer(self.files).__enter__()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.__exit__()
+        self.directory.cleanup()
+
+    def test_downloads_stay_within_budget(self):
+        budget = MemoryBudget(2 ** 17, directory=self.directory.name)
+
+        with DownloadQueue(4, memory_budget=budget) as queue:
+            futures = {path: queue.add(self.server.url(path), os.path.join(self.directory.name, path[1:]))
+                       for path in self.files}
+
+        for path, future in futures.items():
+            future.result()
+            with open(os.path.join(self.directory.name, path[1:]), 'rb') as fd:
+                self.assertEqual(self.files[path], fd.read())
+
+        self.assertLessEqual(budget.peak, 2 ** 17)
+        self.assertGreater(queue.stats()['spills'], 0)
+        self.assertEqual(0, queue.stats()['buffered'])
+        self.assertEqual(sorted(X[1:] for X in self.files), sorted(os.listdir(self.directory.name)))
+        queue.close()
+
+    def test_buffer_is_freed_once_written(self):
+        with DownloadQueue(1) as queue:
+            future = queue.add(self.server.url('/0'), io.BytesIO(), close_fd=False)
+
+        self.assertEqual(self.files['/0'], future.result().destination.getvalue())
+        self.assertTrue(future.result()._download_buffer.closed)
+        self.assertEqual(0, queue.memory.used)
+        self.assertEqual(2 ** 18, queue.memory.peak)
+        queue.close()
+
+    def test_buffer_is_freed_once_failed(self):
+        with DownloadQueue(1) as queue:
+            future = queue.add(self.server.url('/0?truncate=100'), io.BytesIO(), chunk_size=50, attempt_count=1)
+
+        self.assertIsNotNone(future.exception())
+        self.assertEqual(0, queue.stats()['buffered'])
+        self.assertGreater(queue.memory.peak, 0)
+        queue.close()
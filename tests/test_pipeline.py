@@ -0,0 +1,105 @@
+import unittest, functools, gzip, hashlib, io, os, tarfile, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from download_queue import DownloadQueue
+from download_queue.pipeline import Transform, extract_archive
+from http_server import LocalServer
+
+def file_size(path):
+    return os.path.getsize(path)
+
+def fail(path):
+    raise ValueError('unparseable: %s' % os.path.basename(path))
+
+class Upper(Transform):
+    def feed(self, data): return bytes(data).upper()
+
+class TestTransforms(unittest.TestCase):
+    def setUp(self):
+        self.body   = os.urandom(2 ** 15).hex().encode()
+        self.server = LocalServer({'/file.gz': gzip.compress(self.body)}).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_response_is_decompressed_as_it_arrives(self):
+        for stream in (False, True):
+            with DownloadQueue(1) as queue:
+                future = queue.add(self.server.url('/file.gz'), io.BytesIO(), close_fd=False, stream=stream,
+                                   transforms=['gzip', Upper],
+                                   verify={'sha256': hashlib.sha256(self.server.files['/file.gz']).hexdigest()})
+
+            self.assertEqual(self.body.upper(), future.result().destination.getvalue())
+
+    def test_interrupted_response_restarts(self):
+        with DownloadQueue(1) as queue:
+            future = queue.add(self.server.url('/file.gz?truncate=1000'), io.BytesIO(), stream=True, chunk_size=100,
+                               transforms=['gzip'], attempt_count=2, attempt_interval=0)
+
+        self.assertIsNotNone(future.exception())
+        self.assertEqual([None, None], [X[2].get('Range') for X in self.server.requests])
+
+    def test_unknown_transform_is_rejected(self):
+        with DownloadQueue(1) as queue:
+            with self.assertRaises(ValueError):
+                queue.add(self.server.url('/file.gz'), io.BytesIO(), transforms=['zstd'])
+
+class TestProcessing(unittest.TestCase):
+    def setUp(self):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            for name in ('a', 'b'):
+                info = tarfile.TarInfo(name)
+                info.size = 3
+                tar.addfile(info, io.BytesIO(name.encode() * 3))
+
+        self.files     = {'/%d' % X: os.urandom(2 ** 12 * (X + 1)) for X in range(4)}
+        self.files['/data.tar.gz'] = archive.getvalue()
+        self.server    = LocalServer(self.files).__enter__()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.__exit__()
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_downloads_are_processed_on_a_process_pool(self):
+        with DownloadQueue(2, processor=file_size, process_pool=2) as queue:
+            futures = [queue.add(self.server.url('/%d' % X), self.path(str(X))) for X in range(4)]
+            archive = queue.add(self.server.url('/data.tar.gz'), self.path('data.tar.gz'),
+                                process=functools.partial(extract_archive, directory=self.path('data')))
+
+            for future in futures:  # done once processed
+                self.assertEqual(len(self.files[future.downloader.link[-2:]]), future.result().processed)
+            self.assertNotEqual('fork', queue._process_pool()._mp_context.get_start_method())
+        queue.close()
+
+        self.assertEqual([self.path('data/a'), self.path('data/b')], archive.processed)
+        with open(self.path('data/b'), 'rb') as fd:
+            self.assertEqual(b'bbb', fd.read())
+
+    def test_processing_error_fails_future(self):
+        with DownloadQueue(1, processor=fail, process_pool=ThreadPoolExecutor(1)) as queue:
+            future = queue.add(self.server.url('/0'), self.path('0'))
+
+        with self.assertRaisesRegex(ValueError, 'unparseable: 0'):
+            future.result()
+        self.assertTrue(future.downloader.complete)
+
+    def test_processing_backlog_holds_downloads(self):
+        release = threading.Event()
+
+        with DownloadQueue(1, processor=lambda path: release.wait(), process_backlog=1,
+                           process_pool=ThreadPoolExecutor(1)) as queue:
+            futures = [queue.add(self.server.url('/%d' % X), self.path(str(X))) for X in range(3)]
+            time.sleep(0.2)
+
+            # the first is being processed, the second waits for it holding the only slot
+            self.assertEqual(2, len(self.server.requests))
+            self.assertEqual(2, queue.length)
+            self.assertFalse(any(X.done() for X in futures))
+            release.set()
+        queue.close()
+
+        self.assertTrue(all(X.result().processed for X in futures))
@@ -0,0 +1,116 @@
+import unittest, os, io, sys, time, tempfile, subprocess
+from download_queue import GenericDownloader, DownloadQueue
+from http_server import LocalServer
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.body   = os.urandom(2 ** 14)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue  = DownloadQueue(1)
+        self.dest   = os.path.join(self.tmpdir.name, 'file')
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmpdir.cleanup()
+
+    def _download(self, server, dest, **kwargs):
+        downloader = GenericDownloader(self.queue, server.url('/file?truncate=100'), dest, chunk_size=50,
+                                       attempt_count=2, attempt_interval=0, **kwargs)
+        downloader.download()
+        self.assertTrue(downloader.complete)
+        return downloader
+
+    def _range_headers(self, server):
+        return [X[2].get('Range') for X in server.requests]
+
+    def test_retry_resumes_buffered_download(self):
+        with LocalServer({'/file': self.body}) as server:
+            destination = io.BytesIO()
+            self._download(server, destination, close_fd=False)
+
+            self.assertEqual(self.body, destination.getvalue())
+            self.assertEqual([None, 'bytes=100-'], self._range_headers(server))
+
+    def test_retry_resumes_streamed_download(self):
+        with LocalServer({'/file': self.body}) as server:
+            self._download(server, self.dest, stream=True)
+
+            with open(self.dest, 'rb') as fd:
+                self.assertEqual(self.body, fd.read())
+            self.assertEqual([None, 'bytes=100-'], self._range_headers(server))
+            self.assertEqual(['file'], os.listdir(self.tmpdir.name))
+
+    def test_retry_restarts_without_range_support(self):
+        with LocalServer({'/file': self.body}, ranges=False) as server:
+            downloader = GenericDownloader(self.queue, server.url('/file?truncate=100'), io.BytesIO(), chunk_size=50,
+                                           close_fd=False, attempt_count=2, attempt_interval=0)
+            downloader.download()
+
+            # the second attempt asked for the rest of the body, got all of it and restarted
+            self.assertFalse(downloader.complete)
+            self.assertEqual([None, 'bytes=100-'], self._range_headers(server))
+            self.assertEqual(self.body[:100], downloader._download_buffer.getvalue())
+
+    def test_retry_restarts_without_validator(self):
+        with LocalServer({'/file': self.body}, etags=False) as server:
+            downloader = GenericDownloader(self.queue, server.url('/file'), io.BytesIO(), close_fd=False)
+            downloader._download_buffer.write(b'stale')
+            downloader.download()
+
+            self.assertEqual(self.body, downloader.destination.getvalue())
+            self.assertEqual([None], self._range_headers(server))
+
+    def test_resume_partial_file_from_previous_run(self):
+        with LocalServer({'/file': self.body}) as server:
+            failed = GenericDownloader(self.queue, server.url('/file?truncate=100'), self.dest, chunk_size=50,
+                                       stream=True, attempt_count=1)
+            failed.download()
+            self.assertFalse(failed.complete)
+
+            downloader = GenericDownloader(self.queue, server.url('/file'), self.dest, stream=True)
+            downloader.download()
+
+            with open(self.dest, 'rb') as fd:
+                self.assertEqual(self.body, fd.read())
+            self.assertEqual([None, 'bytes=100-'], self._range_headers(server))
+
+    def test_resume_partial_file_from_killed_run(self):
+        body = os.urandom(2 ** 20)
+        with LocalServer({'/file': body}) as server:
+            script = ('import sys\n'
+                      'from download_queue import GenericDownloader, DownloadQueue\n'
+                      'GenericDownloader(DownloadQueue(1), sys.argv[1], sys.argv[2], stream=True,\n'
+                      '                  chunk_size=2 ** 12, bandwidth=2 ** 18).download()\n')
+            root  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            child = subprocess.Popen([sys.executable, '-c', script, server.url('/file'), self.dest],
+                                     env=dict(os.environ, PYTHONPATH=root))
+            try:
+                received = self._wait_for_mark(self.dest + GenericDownloader.validator_suffix)
+            finally:
+                child.kill()
+                child.wait()
+            self.assertIsNotNone(received)
+
+            downloader = GenericDownloader(self.queue, server.url('/file'), self.dest, stream=True)
+            downloader.download()
+
+            with open(self.dest, 'rb') as fd:
+                self.assertEqual(body, fd.read())
+
+            offset = int(self._range_headers(server)[-1][len('bytes='):-1])
+            self.assertGreaterEqual(offset, received)
+            self.assertLess(offset, len(body))
+
+    def _wait_for_mark(self, path, timeout=10):
+        """the bytes received once they've first been marked in the validator file at path"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with open(path) as fd:
+                    lines = fd.read().splitlines()
+            except OSError:
+                lines = []
+            if len(lines) > 1 and int(lines[1]) > 0:
+                return int(lines[1])
+            time.sleep(0.05)
+        return None
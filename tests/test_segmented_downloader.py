@@ -0,0 +1,73 @@
+import unittest, os, tempfile
+from download_queue import SegmentedDownloader, DownloadQueue
+from http_server import LocalServer
+
+class TestSegmentedDownloader(unittest.TestCase):
+    def setUp(self):
+        self.body   = os.urandom(2 ** 16 + 7)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dest   = os.path.join(self.tmpdir.name, 'file')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read_dest(self):
+        with open(self.dest, 'rb') as fd:
+            return fd.read()
+
+    def _ranges(self, server):
+        return sorted(X[2].get('Range') for X in server.requests if X[0] == 'GET')
+
+    def test_file_is_downloaded_in_segments(self):
+        with LocalServer({'/file': self.body}) as server, DownloadQueue(4) as queue:
+            downloader = SegmentedDownloader(queue, server.url('/file'), self.dest, segments=4, min_segment_size=2 ** 10)
+            downloader.download()
+
+            self.assertTrue(downloader.complete)
+            self.assertEqual(self.body, self._read_dest())
+            self.assertEqual(4, len(self._ranges(server)))
+            self.assertEqual(0, queue.length)
+            queue.close()
+
+    def test_segments_run_through_queue(self):
+        with LocalServer({'/file': self.body}) as server:
+            with DownloadQueue(2) as queue:
+                queue.add(server.url('/file'), self.dest, segments=8, min_segment_size=2 ** 10,
+                          download_class=SegmentedDownloader)
+            queue.close()
+
+            self.assertEqual(self.body, self._read_dest())
+            self.assertEqual(8, len(self._ranges(server)))
+
+    def test_merged_downloads_are_copied(self):
+        other = os.path.join(self.tmpdir.name, 'other')
+        with LocalServer({'/file': self.body}) as server:
+            with DownloadQueue(2) as queue:
+                futures = [queue.add(server.url('/file?delay=0.2'), X, segments=4, min_segment_size=2 ** 10,
+                                     download_class=SegmentedDownloader) for X in (self.dest, other)]
+            queue.close()
+
+            self.assertTrue(all(X.exception() is None for X in futures))
+            self.assertEqual(self.body, self._read_dest())
+            with open(other, 'rb') as fd:
+                self.assertEqual(self.body, fd.read())
+            self.assertEqual(4, len(self._ranges(server)))  # only fetched once
+
+    def test_falls_back_when_head_is_rejected(self):
+        with LocalServer({'/file': self.body}) as server, DownloadQueue(2) as queue:
+            future = queue.add(server.url('/file?head_status=405'), self.dest, min_segment_size=2 ** 10,
+                               download_class=SegmentedDownloader)
+            future.result()
+
+            self.assertEqual(self.body, self._read_dest())
+            self.assertEqual([None], self._ranges(server))
+            queue.close()
+
+    def test_falls_back_without_range_support(self):
+        with LocalServer({'/file': self.body}, ranges=False) as server, DownloadQueue(2) as queue:
+            downloader = SegmentedDownloader(queue, server.url('/file'), self.dest, min_segment_size=2 ** 10)
+            downloader.download()
+
+            self.assertEqual(self.body, self._read_dest())
+            self.assertEqual([None], self._ranges(server))
+            queue.close()
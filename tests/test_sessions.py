@@ -0,0 +1,48 @@
+import unittest, io
+from download_queue import DownloadQueue, SessionPool
+from http_server import LocalServer
+
+class TestSessionPool(unittest.TestCase):
+    def test_pool_reuses_session_per_host(self):
+        pool = SessionPool()
+
+        self.assertIs(pool.get('http://a.example/x'), pool.get('http://A.example/y'))
+        self.assertIsNot(pool.get('http://a.example/'), pool.get('http://b.example/'))
+        self.assertEqual(2, len(pool))
+        pool.close()
+
+    def test_pool_evicts_idle_sessions(self):
+        pool = SessionPool(idle_timeout=0)
+        pool.get('http://a.example/')
+        pool.evict_idle()
+
+        self.assertEqual(0, len(pool))
+
+    def test_resize_applies_to_existing_sessions(self):
+        pool    = SessionPool(pool_size=2)
+        session = pool.get('http://a.example/')
+        pool.resize(8)
+
+        self.assertIs(session, pool.get('http://a.example/'))
+        self.assertEqual(8, session.get_adapter('http://a.example/')._pool_maxsize)
+        self.assertEqual(8, pool.get('http://b.example/').get_adapter('http://b.example/')._pool_maxsize)
+        pool.close()
+
+    def test_queue_resize_grows_connection_pools(self):
+        with DownloadQueue(2) as queue:
+            session = queue.sessions.get('http://a.example/')
+            queue.resize(6)
+
+            self.assertEqual(6, session.get_adapter('http://a.example/')._pool_maxsize)
+        queue.close()
+
+    def test_queue_reuses_connections(self):
+        with LocalServer({'/%d' % X: b'x' * 100 for X in range(10)}) as server:
+            queue = DownloadQueue(1)
+
+            for X in range(10):
+                queue.add(server.url('/%d' % X), io.BytesIO(), close_fd=False)
+            queue.close()
+
+            self.assertEqual(10, len(server.requests))
+            self.assertEqual(1, len({X[3] for X in server.requests}))
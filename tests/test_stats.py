@@ -0,0 +1,57 @@
+import unittest, io, os
+from download_queue import DownloadQueue, QueueStats
+from download_queue.stats import Histogram
+from http_server import LocalServer
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram(1)
+        for X in range(1, 101): histogram.record(X)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(100, snapshot['count'])
+        self.assertEqual(1, snapshot['min'])
+        self.assertEqual(100, snapshot['max'])
+        self.assertAlmostEqual(50, snapshot['p50'], delta=10)
+        self.assertAlmostEqual(99, snapshot['p99'], delta=10)
+
+    def test_empty_histogram(self):
+        self.assertIsNone(Histogram(1).percentile(50))
+
+class TestQueueStats(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer({'/%d' % X: os.urandom(2 ** 12) for X in range(5)}).__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_queue_records_downloads(self):
+        sunk = []
+
+        with DownloadQueue(2, metrics=QueueStats(sink=lambda name, value: sunk.append(name))) as queue:
+            for path in self.server.files:
+                queue.add(self.server.url(path), io.BytesIO())
+            queue.add(self.server.url('/error?status=503'), io.BytesIO(), attempt_count=2, attempt_interval=0)
+        queue.close()
+
+        stats = queue.stats()
+        self.assertEqual(6, stats['started'])
+        self.assertEqual(5, stats['succeeded'])
+        self.assertEqual(1, stats['failed'])
+        self.assertEqual(1, stats['retries'])
+        self.assertEqual(5 * 2 ** 12, stats['bytes'])
+        self.assertEqual(6, stats['queue_wait']['count'])
+        self.assertEqual(7, stats['time_to_first_byte']['count'])
+        self.assertEqual(5 * 4, stats['chunk_time']['count'])  # 1KiB chunks
+        self.assertAlmostEqual(1 / 6, stats['failure_rate'])
+        self.assertEqual(0, stats['active'])
+        self.assertIn('retries', sunk)
+
+    def test_chunk_timing_can_be_disabled(self):
+        with DownloadQueue(2, metrics=QueueStats(chunk_timing=False)) as queue:
+            queue.add(self.server.url('/0'), io.BytesIO())
+        queue.close()
+
+        stats = queue.stats()
+        self.assertEqual(0, stats['chunk_time']['count'])
+        self.assertEqual(2 ** 12, stats['bytes'])
@@ -0,0 +1,77 @@
+import unittest, os, io, tempfile
+from download_queue import GenericDownloader, DownloadQueue
+from http_server import LocalServer
+
+class TestStreamingDownloader(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer({'/file': os.urandom(2 ** 16)}).__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue  = DownloadQueue(1)
+        self.dest   = os.path.join(self.tmpdir.name, 'file')
+
+    def tearDown(self):
+        self.queue.close()
+        self.server.__exit__()
+        self.tmpdir.cleanup()
+
+    def test_stream_to_path(self):
+        downloader = GenericDownloader(self.queue, self.server.url('/file'), self.dest, stream=True)
+        downloader.download()
+
+        self.assertTrue(downloader.complete)
+        self.assertFalse(os.path.exists(self.dest + GenericDownloader.partial_suffix))
+        with open(self.dest, 'rb') as fd:
+            self.assertEqual(self.server.files['/file'], fd.read())
+
+    def test_stream_to_file_like_object(self):
+        destination = io.BytesIO()
+        downloader  = GenericDownloader(self.queue, self.server.url('/file'), destination, close_fd=False, stream=True)
+        downloader.download()
+
+        self.assertEqual(self.server.files['/file'], destination.getvalue())
+
+    def test_failed_stream_keeps_partial_file(self):
+        downloader = GenericDownloader(self.queue, self.server.url('/file?truncate=100'), self.dest,
+                                       stream=True, attempt_count=1, chunk_size=50)
+        downloader.download()
+
+        self.assertFalse(downloader.complete)
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertEqual(100, os.path.getsize(self.dest + GenericDownloader.partial_suffix))
+
+    def test_failed_stream_deletes_partial_file(self):
+        downloader = GenericDownloader(self.queue, self.server.url('/file?truncate=100'), self.dest,
+                                       stream=True, attempt_count=1, delete_failed_fd=True)
+        downloader.download()
+
+        self.assertFalse(downloader.complete)
+        self.assertEqual([], os.listdir(self.tmpdir.name))
+
+    def test_stream_respects_existing_files(self):
+        with open(self.dest, 'wb') as fd: fd.write(b'existing')
+
+        downloader = GenericDownloader(self.queue, self.server.url('/file'), self.dest, stream=True, attempt_count=1)
+        downloader.download()
+
+        self.assertFalse(downloader.complete)
+        with open(self.dest, 'rb') as fd:
+            self.assertEqual(b'existing', fd.read())
+
+    def test_known_length_is_read_into_reused_buffer(self):
+        downloader = GenericDownloader(self.queue, self.server.url('/file'), io.BytesIO(), chunk_size=2 ** 12)
+        chunks     = [(X.obj, bytes(X)) for X in downloader._iterate_response_chunks()]
+
+        self.assertEqual(16, len(chunks))
+        self.assertEqual(1, len({id(X[0]) for X in chunks}))
+        self.assertEqual(self.server.files['/file'], b''.join(X[1] for X in chunks))
+
+    @unittest.skipUnless(hasattr(os, 'posix_fallocate'), 'requires posix_fallocate')
+    def test_partial_file_is_preallocated(self):
+        downloader = GenericDownloader(self.queue, self.server.url('/file'), self.dest, stream=True)
+        sizes      = []
+        downloader._throttle = lambda count: sizes.append(os.path.getsize(self.dest + GenericDownloader.partial_suffix))
+        downloader.download()
+
+        self.assertTrue(downloader.complete)
+        self.assertEqual(2 ** 16, sizes[0])
+        self.assertEqual(2 ** 16, os.path.getsize(self.dest))